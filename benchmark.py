@@ -0,0 +1,327 @@
+"""Benchmark the download path against a local mock of the Tidal API and CDN."""
+
+import asyncio
+import base64
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+import click
+from aiohttp import web
+
+from config import Config
+from tidal import TidalClient
+
+BLOCK = os.urandom(1024 * 1024)  # synthetic audio is this block repeated
+SEGMENT_SIZE = 256 * 1024  # bytes per DASH media segment
+WRITE_SIZE = 64 * 1024  # bytes per CDN write, the unit bandwidth is throttled in
+
+def synthetic(size: int, start: int = 0, end: int = None) -> bytes:
+    """Bytes start..end of a body of size that begins with a FLAC marker."""
+    end = size if end is None else end
+    body = bytearray()
+    position = start
+    while position < end:
+        offset = position % len(BLOCK)
+        take = min(len(BLOCK) - offset, end - position)
+        body += BLOCK[offset:offset + take]
+        position += take
+    if start == 0:
+        body[:4] = b"fLaC"
+    return bytes(body)
+
+class MockTidal:
+    """aiohttp app that answers like the Tidal API, OAuth and CDN hosts.
+
+    latency is added before every response, bandwidth (bytes/s) caps each
+    CDN response, and error_rate is the share of CDN requests that fail,
+    half with a 503 and half by dropping the connection mid-body.
+    """
+
+    def __init__(self, track_size: int = 30 * 1024 ** 2, manifest: str = "bts",
+                 latency: float = 0.0, bandwidth: float = 0.0, error_rate: float = 0.0):
+        self.track_size = track_size
+        self.manifest = manifest
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.url = ""
+        self.requests = 0
+        self.errors = 0
+        self._runner = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_post("/oauth2/token", self.token)
+        app.router.add_get("/v1/sessions", self.sessions)
+        app.router.add_get("/v1/tracks/{id}", self.track)
+        app.router.add_get("/v1/tracks/{id}/playbackinfopostpaywall", self.playbackinfo)
+        app.router.add_route("*", "/cdn/{id}.flac", self.cdn)
+        app.router.add_get("/dash/{id}/{n}.mp4", self.segment)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _delay(self):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def token(self, request: web.Request) -> web.Response:
+        await self._delay()
+        return web.json_response({
+            "access_token": f"mock-{time.time()}",
+            "refresh_token": "mock-refresh",
+            "expires_in": 86400,
+            "user": {"userId": 1, "countryCode": "US"},
+        })
+
+    async def sessions(self, request: web.Request) -> web.Response:
+        await self._delay()
+        return web.json_response({"sessionId": "mock", "userId": 1, "countryCode": "US"})
+
+    async def track(self, request: web.Request) -> web.Response:
+        await self._delay()
+        track_id = request.match_info["id"]
+        return web.json_response({
+            "id": int(track_id),
+            "title": f"Track {track_id}",
+            "duration": 180,
+            "artist": {"name": "Mock Artist"},
+            "album": {"title": "Mock Album"},
+        })
+
+    async def playbackinfo(self, request: web.Request) -> web.Response:
+        await self._delay()
+        track_id = request.match_info["id"]
+        if self.manifest == "dash":
+            mime, manifest = "application/dash+xml", self._mpd(track_id)
+        else:
+            mime = "application/vnd.tidal.bts"
+            manifest = json.dumps({"codecs": "flac", "urls": [f"{self.url}/cdn/{track_id}.flac"]})
+        return web.json_response({
+            "trackId": int(track_id),
+            "manifestMimeType": mime,
+            "manifest": base64.b64encode(manifest.encode()).decode(),
+        })
+
+    def _mpd(self, track_id: str) -> str:
+        count = -(-self.track_size // SEGMENT_SIZE)
+        return (
+            '<?xml version="1.0"?>'
+            '<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" mediaPresentationDuration="PT3M">'
+            '<Period><AdaptationSet contentType="audio">'
+            '<Representation id="FLAC" codecs="flac" bandwidth="1411000">'
+            f'<SegmentTemplate timescale="1" startNumber="1" '
+            f'initialization="{self.url}/dash/{track_id}/0.mp4" '
+            f'media="{self.url}/dash/{track_id}/$Number$.mp4">'
+            f'<SegmentTimeline><S d="4" r="{count - 1}"/></SegmentTimeline>'
+            '</SegmentTemplate></Representation></AdaptationSet></Period></MPD>'
+        )
+
+    async def cdn(self, request: web.Request) -> web.StreamResponse:
+        await self._delay()
+        size = self.track_size
+        if request.method == "HEAD":
+            return web.Response(headers={"Content-Length": str(size), "Accept-Ranges": "bytes"})
+
+        start, end = 0, size
+        status = 200
+        headers = {"Accept-Ranges": "bytes"}
+        if "Range" in request.headers:
+            first, _, last = request.headers["Range"].removeprefix("bytes=").partition("-")
+            start, end = int(first), int(last) + 1 if last else size
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+        return await self._send(request, status, headers, start, end, size)
+
+    async def segment(self, request: web.Request) -> web.StreamResponse:
+        await self._delay()
+        number = int(request.match_info["n"])
+        if number == 0:
+            return web.Response(body=b"\x00\x00\x00\x18ftypiso6")  # tiny init segment
+        start = (number - 1) * SEGMENT_SIZE
+        end = min(start + SEGMENT_SIZE, self.track_size)
+        return await self._send(request, 200, {}, start, end, self.track_size)
+
+    async def _send(self, request, status, headers, start, end, size) -> web.StreamResponse:
+        fail = random.random() < self.error_rate
+        if fail and random.random() < 0.5:
+            self.errors += 1
+            return web.Response(status=503)
+
+        resp = web.StreamResponse(status=status, headers=headers)
+        resp.content_length = end - start
+        # Drop the connection somewhere in the body
+        cut = random.randrange(start, end) if fail else end
+        try:
+            await resp.prepare(request)
+            position = start
+            while position < cut:
+                chunk = synthetic(size, position, min(position + WRITE_SIZE, cut))
+                await resp.write(chunk)
+                position += len(chunk)
+                if self.bandwidth:
+                    await asyncio.sleep(len(chunk) / self.bandwidth)
+            if fail:
+                self.errors += 1
+                request.transport.close()
+                return resp
+            await resp.write_eof()
+        except ConnectionResetError:
+            pass  # the client gave up on this response, e.g. a cancelled DASH window
+        return resp
+
+class LoopLag:
+    """Samples how late the event loop wakes a sleeping task."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: list[float] = []
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(time.perf_counter() - started - self.interval)
+
+    async def stop(self):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+async def run_round(mock: MockTidal, concurrency: int, tracks: int, segments: int, folder: str) -> dict:
+    """Download tracks through TidalClient with concurrency workers and time them."""
+    config = Config()
+    config.tidal.api_url = f"{mock.url}/v1"
+    config.tidal.auth_url = f"{mock.url}/oauth2"
+    config.tidal.access_token = "mock"
+    config.tidal.refresh_token = "mock-refresh"
+    config.tidal.token_expiry = str(time.time() + 86400)
+    config.downloads.folder = folder
+    config.downloads.segments = segments
+    config.downloads.requests_per_minute = 1_000_000  # measure the client, not the budget
+    config.cache.path = os.path.join(folder, "cache.db")
+
+    client = TidalClient(config)
+    lag = LoopLag()
+    latencies = []
+    sizes = []
+    failures = 0
+    queue = asyncio.Queue()
+    for track_id in range(1000, 1000 + tracks):
+        queue.put_nowait(str(track_id))
+
+    async def worker():
+        nonlocal failures
+        while not queue.empty():
+            track_id = queue.get_nowait()
+            started = time.perf_counter()
+            received = 0
+
+            def on_chunk(size):
+                nonlocal received
+                received += size
+
+            try:
+                await client.get_metadata(track_id, "track")
+                downloadable = await client.get_downloadable(track_id, config.tidal.quality)
+                path = os.path.join(folder, f"{track_id}.{downloadable.extension}")
+                await downloadable.download(path, on_chunk)
+                os.remove(path)
+            except Exception as e:
+                failures += 1
+                print(f"Track {track_id} failed: {e!r}")
+                continue
+            latencies.append(time.perf_counter() - started)
+            sizes.append(received)
+
+    try:
+        await client.login()
+        lag.start()
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    finally:
+        await lag.stop()
+        await client.close()
+
+    return {
+        "concurrency": concurrency,
+        "tracks": len(latencies),
+        "failures": failures,
+        "mb": sum(sizes) / 1024 ** 2,
+        "mb_s": sum(sizes) / 1024 ** 2 / elapsed if elapsed else 0.0,
+        "p50": statistics.median(latencies) if latencies else 0.0,
+        "p99": percentile(latencies, 0.99),
+        "lag_p99": percentile(lag.samples, 0.99) * 1000,
+        "lag_max": max(lag.samples, default=0.0) * 1000,
+    }
+
+async def main(concurrency: list[int], tracks: int, size_mb: float, manifest: str, segments: int,
+               latency: float, bandwidth: float, error_rate: float) -> list[dict]:
+    mock = MockTidal(
+        track_size=int(size_mb * 1024 ** 2),
+        manifest=manifest,
+        latency=latency,
+        bandwidth=bandwidth * 1024 ** 2,
+        error_rate=error_rate,
+    )
+    await mock.start()
+    folder = tempfile.mkdtemp(prefix="tidal-bench-")
+    results = []
+    try:
+        print(f"{'conc':>4} {'tracks':>6} {'fail':>4} {'MB':>8} {'MB/s':>8} "
+              f"{'p50 s':>7} {'p99 s':>7} {'lag p99 ms':>10} {'lag max ms':>10}")
+        for index, workers in enumerate(concurrency):
+            # Fresh folder and metadata cache, so every round makes the same API calls
+            round_folder = os.path.join(folder, f"round{index}")
+            os.makedirs(round_folder)
+            result = await run_round(mock, workers, tracks, segments, round_folder)
+            results.append(result)
+            print(f"{result['concurrency']:>4} {result['tracks']:>6} {result['failures']:>4} "
+                  f"{result['mb']:>8.1f} {result['mb_s']:>8.2f} {result['p50']:>7.2f} "
+                  f"{result['p99']:>7.2f} {result['lag_p99']:>10.1f} {result['lag_max']:>10.1f}")
+        print(f"\nMock served {mock.requests} requests, injected {mock.errors} errors")
+    finally:
+        await mock.close()
+        shutil.rmtree(folder, ignore_errors=True)
+    return results
+
+@click.command()
+@click.option('--concurrency', '-j', default='1,4,8', help='Comma-separated worker counts, one round each')
+@click.option('--tracks', '-n', type=int, default=16, help='Tracks downloaded per round')
+@click.option('--size', type=float, default=30.0, help='Synthetic track size in MB')
+@click.option('--manifest', type=click.Choice(['bts', 'dash']), default='bts', help='Manifest type served')
+@click.option('--segments', '-s', type=int, default=1, help='Parallel Range requests per file (BTS only)')
+@click.option('--latency', type=float, default=0.0, help='Seconds added before every response')
+@click.option('--bandwidth', type=float, default=0.0, help='Per-response CDN bandwidth cap in MB/s (0 = none)')
+@click.option('--error-rate', type=float, default=0.0, help='Share of CDN requests that fail (0-1)')
+def benchmark(concurrency, tracks, size, manifest, segments, latency, bandwidth, error_rate):
+    """Measure download throughput, latency and event-loop lag against a mock Tidal."""
+    workers = [int(value) for value in concurrency.split(',') if value.strip()]
+    asyncio.run(main(workers, tracks, size, manifest, segments, latency, bandwidth, error_rate))
+
+if __name__ == "__main__":
+    benchmark()
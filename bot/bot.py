@@ -3,13 +3,41 @@ import os
 import logging
 from pathlib import Path
 import re
+import secrets
+import signal
+import sys
+import time
+from contextlib import AsyncExitStack
+from typing import Optional
 
 from aiogram import Bot, Dispatcher, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
 from aiogram.types import Message, FSInputFile
 
+# The download code shared with cli.py lives in common/ at the repository root
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import metrics
 from config import Config
-from tidal_client import TidalClient, TidalAuth, BASE
+from tidal_client import QUALITY_MAP, TidalClient, BASE
+from singleflight import SingleFlight
+from sizes import TrackSizes
+from fileids import FileIdCache
+from jobqueue import JobQueue, QueuedJob
+from common.integrity import verified
+from library import Library
+from metrics import STAGE_SECONDS, TRANSFER_BYTES, TRANSFER_SECONDS
+from planner import BOT_API_UPLOAD_LIMIT, LOCAL_API_UPLOAD_LIMIT, QualityPlanner
+from common.progress import ProgressUpdate
+from scheduler import Job, QueueFull, Scheduler
+from common.session import SessionFactory
+from streaming import StreamInputFile
+from webhook import WebhookServer
+from workers import WorkerProcesses
+from workerstats import WorkerStats
 
 # Configure logging
 logging.basicConfig(
@@ -20,21 +48,123 @@ logger = logging.getLogger(__name__)
 
 # Initialize config and bot
 config = Config()
-bot = Bot(token=config.BOT_TOKEN)
+bot = Bot(
+    token=config.BOT_TOKEN,
+    session=AiohttpSession(api=TelegramAPIServer.from_base(config.TELEGRAM_API_URL))
+    if config.TELEGRAM_API_URL else None,
+)
 dp = Dispatcher()
 
 # Global tidal client instance
 tidal_client = None
 
+# One set of connection pools for auth, API and CDN traffic for the whole process
+sessions = SessionFactory(
+    verify_ssl=config.VERIFY_SSL,
+    api_connections=config.API_CONNECTIONS,
+    cdn_connections=config.CDN_CONNECTIONS,
+    cdn_connections_per_host=config.CDN_CONNECTIONS_PER_HOST,
+    keepalive_timeout=config.KEEPALIVE_TIMEOUT,
+    dns_cache_ttl=config.DNS_CACHE_TTL,
+)
+
+# Concurrent requests for the same (track_id, quality) share one download and upload
+downloads = SingleFlight()
+uploads = SingleFlight()
+
+# Telegram file_ids of tracks we already uploaded
+file_ids = FileIdCache(config.CACHE_DB)
+
+# Downloaded files kept around for repeat requests
+library = Library(config.CACHE_DB, config.LIBRARY_MAX_BYTES)
+
+# Best quality up to config.QUALITY that Telegram will take, decided before downloading
+planner = QualityPlanner(
+    config.UPLOAD_LIMIT or (LOCAL_API_UPLOAD_LIMIT if config.TELEGRAM_API_URL else BOT_API_UPLOAD_LIMIT),
+    config.QUALITY,
+    TrackSizes(config.CACHE_DB),
+    margin=config.TAG_MARGIN if config.TAG_FILES else 0,
+)
+
+# With WORKER_PROCESSES set, jobs go through this queue to separate processes
+jobs = JobQueue(config.CACHE_DB)
+workers = WorkerProcesses(os.path.abspath(__file__), config.WORKER_PROCESSES) if config.WORKER_PROCESSES else None
+shown_positions: dict[int, int] = {}  # job id -> queue position last shown to the user
+queue_counts = [0, 0]  # waiting and running jobs, refreshed by update_positions()
+worker_stats = WorkerStats(config.CACHE_DB)  # each worker's metrics, merged by /stats
+worker_index: Optional[int] = None  # set in worker processes
+
 def is_valid_track_id(text: str) -> bool:
     """Check if text is a valid Tidal track ID (numeric)."""
     return text.isdigit() and len(text) >= 3
 
-async def startup():
+def status_progress(status_msg: Message, artist: str, title: str):
+    """Progress renderer that edits the status message with speed and ETA."""
+    async def render(update: ProgressUpdate):
+        try:
+            await status_msg.edit_text(f"⬇️ Downloading: {artist} - {title}\n{update.describe()}")
+        except Exception as e:
+            # Rate limits or "message is not modified" must never fail the download
+            logger.debug(f"Progress update failed: {e}")
+    return render
+
+async def fetch_track(track_id: str, quality: int, track_info: dict, artist: str, title: str,
+                      resolved=None, status_msg: Optional[Message] = None):
+    """Download a track into the library and return its path."""
+    on_progress = status_progress(status_msg, artist, title) if status_msg else None
+    filepath = await tidal_client.download_track(
+        track_id, quality, track_info=track_info, resolved=resolved, on_progress=on_progress
+    )
+    if filepath:
+        await library.add(track_id, quality, filepath, artist, title)
+        await planner.remember(track_id, quality, os.path.getsize(filepath))
+    return filepath
+
+async def pinned_tracks() -> set:
+    """Library keys that must stay on disk: tracks being sent here or by any worker process."""
+    pinned = set(downloads.keys())
+    if config.WORKER_PROCESSES:
+        # The quality a worker settled on isn't in the queue, so pin them all
+        pinned |= {(track_id, quality) for track_id in await jobs.running_tracks()
+                   for quality in QUALITY_MAP}
+    return pinned
+
+async def release_track(filepath):
+    """Trim the library once nobody is sending this track anymore."""
+    await library.evict(pinned=await pinned_tracks())
+
+async def send_cached(message: Message, track_id: str) -> bool:
+    """Answer from the file_id cache; returns False if there is nothing usable."""
+    # Earlier uploads were planned to fit, so the best one cached is the one to send
+    cached = await file_ids.best(track_id, config.QUALITY)
+    if not cached:
+        return False
+        
+    quality, file_id, caption = cached
+    try:
+        await message.answer_audio(audio=file_id, caption=caption)
+    except TelegramBadRequest as e:
+        # Telegram no longer knows this file_id; fall back to a fresh upload
+        logger.warning(f"Stale file_id for track {track_id}: {e}")
+        await file_ids.invalidate(track_id, quality)
+        return False
+    return True
+
+def new_tidal_client() -> TidalClient:
+    """Client for this process's share of the API rate.
+    
+    Only the front process refreshes tokens; workers pick up what it saves
+    to the accounts file, so a rotated refresh token is never spent twice.
+    """
+    processes = config.WORKER_PROCESSES + 1 if config.WORKER_PROCESSES else 1
+    return TidalClient(config, sessions, refresh=worker_index is None,
+                       requests_per_minute=config.REQUESTS_PER_MINUTE / processes)
+
+async def startup(notify: bool = True):
     """Initialize Tidal client on startup."""
     global tidal_client
     
-    tidal_client = TidalClient(config)
+    tidal_client = new_tidal_client()
     
     # Try to login with saved tokens
     if await tidal_client.login():
@@ -43,7 +173,7 @@ async def startup():
         logger.warning("❌ No valid tokens found. Use /login command to authenticate.")
         
     # Send startup notification to admin
-    if config.ADMIN_ID:
+    if notify and config.ADMIN_ID:
         try:
             await bot.send_message(config.ADMIN_ID, "🤖 Bot started successfully")
         except:
@@ -62,7 +192,8 @@ async def cmd_start(message: Message):
         "Commands:\n"
         "/login - Login to Tidal (device flow)\n"
         "/status - Check Tidal connection\n"
-        "/clean - Clean download folder"
+        "/clean - Clean download folder\n"
+        "/stats - Latency, throughput and cache stats"
     )
 
 @dp.message(Command("login"))
@@ -74,8 +205,13 @@ async def cmd_login(message: Message):
         
     await message.answer("Starting Tidal authentication...")
     
-    # Create auth instance
-    auth = TidalAuth(config)
+    # The new account joins the running client's pool (replacing an older
+    # login of the same user), so nothing is left open; workers pick it up
+    # from the accounts file
+    global tidal_client
+    if tidal_client is None:
+        tidal_client = new_tidal_client()
+    auth = tidal_client.auth.new_account()
     
     # Start device login
     msg = await message.answer("Please check bot logs for login URL...")
@@ -84,12 +220,11 @@ async def cmd_login(message: Message):
     success = await auth.device_login()
     
     if success:
-        await msg.edit_text("✅ Login successful! Tokens saved.\nYou can now download tracks.")
-        
-        # Reinitialize client with new tokens
-        global tidal_client
-        tidal_client = TidalClient(config)
+        await tidal_client.auth.add(auth)
         await tidal_client.login()
+        accounts = len(tidal_client.auth.accounts)
+        await msg.edit_text(f"✅ Login successful! Tokens saved ({accounts} account(s) in the pool).\n"
+                            "You can now download tracks.")
     else:
         await msg.edit_text("❌ Login failed. Please try again.")
 
@@ -110,15 +245,24 @@ async def cmd_status(message: Message):
     try:
         # Simple API call to check connection
         params = {"countryCode": "US", "limit": 1}
-        async with tidal_client.session.get(f"{BASE}/tracks/123", params=params) as resp:
+        async with tidal_client.request("GET", f"{BASE}/tracks/123", params=params) as resp:
             status = resp.status
             
         if status == 401:
-            await message.answer("⚠️ Tidal token expired. Use /login to refresh.")
+            text = "⚠️ Tidal token expired. Use /login to refresh."
         elif status == 200 or status == 404:
-            await message.answer("✅ Tidal connection is working")
+            text = "✅ Tidal connection is working"
         else:
-            await message.answer(f"⚠️ Tidal status: {status}")
+            text = f"⚠️ Tidal status: {status}"
+            
+        # Connection reuse per pool
+        for name, stats in sessions.stats().items():
+            text += (
+                f"\n🔌 {name.upper()} pool: {stats['requests']} requests, "
+                f"{stats['connections_created']} new / {stats['connections_reused']} reused connections "
+                f"({stats['reuse_ratio']:.0%} reuse)"
+            )
+        await message.answer(text)
             
     except Exception as e:
         await message.answer(f"❌ Tidal error: {str(e)}")
@@ -131,16 +275,101 @@ async def cmd_clean(message: Message):
         return
         
     try:
-        # Remove all files in download folder
-        for file in os.listdir(config.DOWNLOAD_FOLDER):
-            file_path = os.path.join(config.DOWNLOAD_FOLDER, file)
-            if os.path.isfile(file_path):
-                os.remove(file_path)
+        # Remove every library file that isn't being sent right now
+        freed = await library.clear(pinned=await pinned_tracks())
                 
-        await message.answer(f"🧹 Cleaned {config.DOWNLOAD_FOLDER} folder")
+        await message.answer(f"🧹 Cleaned {config.DOWNLOAD_FOLDER} folder ({freed / 1024 ** 2:.1f} MB freed)")
     except Exception as e:
         await message.answer(f"❌ Error cleaning: {str(e)}")
 
+def cache_lookups():
+    """(labels, value) pairs for every cache's hit and miss counters."""
+    caches = {"file_id": file_ids, "library": library}
+    if tidal_client:
+        caches["metadata"] = tidal_client.metadata
+        caches["manifest"] = tidal_client.manifests
+    for name, cache in caches.items():
+        yield {"cache": name, "result": "hit"}, cache.hits + getattr(cache, "disk_hits", 0)
+        yield {"cache": name, "result": "miss"}, cache.misses
+
+def pool_connections():
+    for pool, stats in sessions.stats().items():
+        yield {"pool": pool, "state": "created"}, stats["connections_created"]
+        yield {"pool": pool, "state": "reused"}, stats["connections_reused"]
+
+metrics.Gauge("tidalbot_queue_depth", "Jobs waiting for a download worker",
+              lambda: queue_counts[0] if workers else scheduler.depth)
+metrics.Gauge("tidalbot_jobs_active", "Jobs in the download or upload stage",
+              lambda: queue_counts[1] if workers else scheduler.active)
+CACHE_LOOKUPS = metrics.Gauge("tidalbot_cache_lookups_total", "Cache lookups by result", cache_lookups,
+                              labels=("cache", "result"), kind="counter")
+metrics.Gauge("tidalbot_pool_connections_total", "Connections opened or reused per pool",
+              pool_connections, labels=("pool", "state"), kind="counter")
+
+def account_stats(field: str):
+    """(labels, value) pairs of one field per pooled Tidal account."""
+    if not tidal_client:
+        return
+    for stats in tidal_client.auth.stats():
+        yield {"account": stats["account"]}, int(stats[field])
+
+metrics.Gauge("tidalbot_account_healthy", "1 if the account is in rotation",
+              lambda: account_stats("healthy"), labels=("account",))
+metrics.Gauge("tidalbot_account_requests_active", "API requests in flight per account",
+              lambda: account_stats("active"), labels=("account",))
+metrics.Gauge("tidalbot_account_ejections_total", "Times the account was taken out of rotation",
+              lambda: account_stats("ejections"), labels=("account",), kind="counter")
+
+@dp.message(Command("stats"))
+async def cmd_stats(message: Message):
+    """Show per-stage latency, throughput, cache and queue metrics."""
+    if config.ADMIN_ID and message.from_user.id != config.ADMIN_ID:
+        await message.answer("⛔ Access denied")
+        return
+        
+    # In worker mode the downloads and uploads happen in the workers
+    snapshots = await worker_stats.collect() if workers else []
+    stages = STAGE_SECONDS.combined(snapshots)
+    moved_bytes = TRANSFER_BYTES.combined(snapshots)
+    spent_seconds = TRANSFER_SECONDS.combined(snapshots)
+    
+    lines = ["📊 Stage latency (count, p50 / p95 seconds)"]
+    for labels in stages.keys():
+        summary = stages.summary(**labels)
+        lines.append(f"• {labels['stage']}: {summary['count']}, "
+                     f"{summary['p50']:.2f} / {summary['p95']:.2f}")
+        
+    lines.append("\n🚚 Throughput")
+    for direction in ("cdn", "upload", "stream"):
+        moved = moved_bytes.get(direction=direction)
+        spent = spent_seconds.get(direction=direction)
+        if spent:
+            lines.append(f"• {direction}: {moved / 1024 ** 2:.1f} MB at {moved / spent / 1024 ** 2:.2f} MB/s")
+            
+    lines.append("\n🗃 Cache hit ratio")
+    totals: dict = {}
+    for labels, value in CACHE_LOOKUPS.combined(snapshots).items():
+        totals.setdefault(labels["cache"], {})[labels["result"]] = value
+    for name, counts in totals.items():
+        lookups = counts["hit"] + counts["miss"]
+        ratio = counts["hit"] / lookups if lookups else 0.0
+        lines.append(f"• {name}: {ratio:.0%} of {lookups}")
+        
+    if tidal_client:
+        lines.append("\n👥 Accounts")
+        for stats in tidal_client.auth.stats():
+            state = "ok" if stats["healthy"] else f"out for {stats['ejected_for']:.0f}s"
+            lines.append(f"• {stats['account']}: {state}, {stats['active']} active, "
+                         f"{stats['ejections']} ejections")
+        
+    if workers:
+        waiting, running = await jobs.counts()
+        lines.append(f"\n🕒 Queue: {waiting} waiting, {running} active "
+                     f"on {workers.alive} worker processes")
+    else:
+        lines.append(f"\n🕒 Queue: {scheduler.depth} waiting, {scheduler.active} active")
+    await message.answer("\n".join(lines))
+
 @dp.message()
 async def handle_track_id(message: Message):
     """Handle track ID messages."""
@@ -155,64 +384,449 @@ async def handle_track_id(message: Message):
         # Not a valid track ID, ignore
         return
         
-    # Check if client is ready
-    global tidal_client
-    if not tidal_client or not tidal_client.session:
-        await message.answer("❌ Tidal client not ready. Use /login first.")
+    # Already uploaded once: resend by file_id without touching Tidal
+    started = time.monotonic()
+    if await send_cached(message, track_id):
+        STAGE_SECONDS.observe(time.monotonic() - started, stage="cached_reply")
+        return
+        
+    if workers:
+        await enqueue(message, track_id)
+        return
+        
+    # Politely reject when the queue is full
+    try:
+        scheduler.check(message.from_user.id)
+    except QueueFull as e:
+        await message.answer(f"⏳ {e}")
         return
         
     # Send processing message
     status_msg = await message.answer(f"🔍 Processing track ID: {track_id}")
     
+    job = Job(message.from_user.id, track_id, message, status_msg)
     try:
-        # Get track info first
-        track_info = await tidal_client.get_track_info(track_id)
-        if not track_info:
-            await status_msg.edit_text(f"❌ Track {track_id} not found")
-            return
-            
-        artist = track_info.get('artist', {}).get('name', 'Unknown Artist')
-        title = track_info.get('title', 'Unknown Track')
+        position = scheduler.submit(job)
+    except QueueFull as e:
+        await status_msg.edit_text(f"⏳ {e}")
+        return
         
-        await status_msg.edit_text(f"⬇️ Downloading: {artist} - {title}")
+    if position > scheduler.download_workers - scheduler.active:
+        await show_position(job, position)
+
+async def enqueue(message: Message, track_id: str):
+    """Queue a track in the shared job queue for the worker processes."""
+    try:
+        await jobs.check(message.from_user.id, config.MAX_QUEUE, config.MAX_USER_QUEUE)
+    except QueueFull as e:
+        await message.answer(f"⏳ {e}")
+        return
         
-        # Download track
-        filepath = await tidal_client.download_track(track_id)
+    status_msg = await message.answer(f"🔍 Processing track ID: {track_id}")
+    
+    # Workers rebuild both messages from this to answer and edit them
+    payload = {
+        "message": message.model_dump(mode="json", exclude_none=True),
+        "status": status_msg.model_dump(mode="json", exclude_none=True),
+    }
+    try:
+        job_id, position = await jobs.put(message.from_user.id, track_id, payload,
+                                          config.MAX_QUEUE, config.MAX_USER_QUEUE)
+    except QueueFull as e:
+        await status_msg.edit_text(f"⏳ {e}")
+        return
         
+    shown_positions[job_id] = position
+    _, running = await jobs.counts()
+    if position > config.WORKER_PROCESSES * config.DOWNLOAD_WORKERS - running:
+        await status_msg.edit_text(f"🕒 Track {track_id} queued, position {position}")
+
+async def update_positions():
+    """Front process: keep queue positions in the status messages of waiting jobs current."""
+    while True:
+        await asyncio.sleep(config.QUEUE_UPDATE_INTERVAL)
+        try:
+            queue_counts[:] = await jobs.counts()
+            waiting = await jobs.waiting()
+        except Exception as e:
+            logger.warning(f"Job queue unavailable: {e}")
+            continue
+            
+        for position, queued in enumerate(waiting, 1):
+            shown = shown_positions.get(queued.id)
+            shown_positions[queued.id] = position
+            if shown is None or shown == position:
+                continue
+            status = queued.payload["status"]
+            try:
+                await bot.edit_message_text(
+                    f"🕒 Track {queued.track_id} queued, position {position}",
+                    chat_id=status["chat"]["id"],
+                    message_id=status["message_id"],
+                )
+            except Exception as e:
+                logger.debug(f"Position update failed: {e}")
+        for job_id in set(shown_positions) - {queued.id for queued in waiting}:
+            del shown_positions[job_id]
+
+async def show_position(job: Job, position: int):
+    """Live queue-position updates through the status message."""
+    await job.status_msg.edit_text(f"🕒 Track {job.track_id} queued, position {position}")
+
+async def download_stage(job: Job) -> bool:
+    """Resolve and download a queued track; True hands it to the upload stage."""
+    track_id, status_msg = job.track_id, job.status_msg
+    stack = AsyncExitStack()
+    STAGE_SECONDS.observe(time.monotonic() - job.queued_at, stage="queue_wait")
+    
+    try:
+        # Library hit: no Tidal API call needed at all
+        found = await library.best(track_id, config.QUALITY, planner.max_size)
+        if found:
+            quality, entry = found
+            key = (track_id, quality)
+            artist, title = entry.artist, entry.title
+            
+            async def fetch():
+                return entry.path
+        else:
+            # Check if client is ready
+            if not tidal_client or not tidal_client.session:
+                await status_msg.edit_text("❌ Tidal client not ready. Use /login first.")
+                return False
+                
+            # Get track info first
+            track_info = await tidal_client.get_track_info(track_id)
+            if not track_info:
+                await status_msg.edit_text(f"❌ Track {track_id} not found")
+                return False
+                
+            artist = track_info.get('artist', {}).get('name', 'Unknown Artist')
+            title = track_info.get('title', 'Unknown Track')
+            
+            # Settle the quality before downloading anything that can't be sent
+            with STAGE_SECONDS.time(stage="planning"):
+                plan = await planner.plan(tidal_client, track_id, track_info)
+            if plan is None:
+                await status_msg.edit_text(f"❌ {artist} - {title} is too large to send in any quality")
+                return False
+            if plan.quality < config.QUALITY:
+                logger.info(f"Track {track_id} goes out as {QUALITY_MAP[plan.quality]} "
+                            f"to stay under the upload limit")
+            quality, resolved = plan.quality, plan.resolved
+            key = (track_id, quality)
+            
+            # Streaming mode: pipe the CDN body into the upload instead of downloading first
+            if config.STREAM_UPLOADS and key not in downloads:
+                resolved = resolved or await tidal_client.resolve_track(track_id, quality, track_info)
+                if not resolved:
+                    await status_msg.edit_text(f"❌ Failed to download track {track_id}")
+                    return False
+                downloadable, filepath = resolved
+                size = plan.size if plan.resolved else await downloadable.size()
+                if 0 < size <= config.STREAM_MAX_SIZE and not verified(filepath):
+                    fetch = lambda: fetch_track(track_id, quality, track_info, artist, title,
+                                                resolved, status_msg)
+                    job.state.update(key=key, artist=artist, title=title, stack=stack, fetch=fetch,
+                                     track_info=track_info, stream=(downloadable, filepath, size))
+                    return True
+                
+            fetch = lambda: fetch_track(track_id, quality, track_info, artist, title,
+                                        resolved, status_msg)
+            
+            await status_msg.edit_text(f"⬇️ Downloading: {artist} - {title}")
+        
+        # Download track (shared with concurrent requests for the same track).
+        # The reference is held until the upload stage closes the stack.
+        filepath = await stack.enter_async_context(
+            downloads.join(key, fetch, cleanup=release_track)
+        )
         if not filepath or not os.path.exists(filepath):
+            await stack.aclose()
             await status_msg.edit_text(f"❌ Failed to download track {track_id}")
-            return
+            return False
             
-        # Send file
-        await status_msg.edit_text(f"📤 Sending file...")
+        await status_msg.edit_text(f"📤 Waiting to send: {artist} - {title}")
+        job.state.update(key=key, filepath=filepath, artist=artist, title=title, stack=stack)
+        return True
         
-        # Create FSInputFile
-        audio_file = FSInputFile(filepath)
+    except Exception as e:
+        await stack.aclose()
+        logger.error(f"Error processing track {track_id}: {e}")
+        await status_msg.edit_text(f"❌ Error: {str(e)}")
+        return False
+
+async def deliver(job: Job, send):
+    """Upload once per track through send(); other requesters reuse its file_id."""
+    message, track_id = job.message, job.track_id
+    artist, title = job.state["artist"], job.state["title"]
+    
+    async with uploads.join(job.state["key"], send) as sent:
+        if sent.chat.id == message.chat.id:
+            quality = job.state["key"][1]
+            await file_ids.set(track_id, quality, sent.audio.file_id, sent.caption or "")
+        else:
+            await message.answer_audio(
+                audio=sent.audio.file_id,
+                caption=f"{artist} - {title}",
+                title=title,
+                performer=artist
+            )
+
+async def timed_send(direction: str, size: int, send):
+    """Await send() and record it as a transfer of size bytes."""
+    started = time.monotonic()
+    with STAGE_SECONDS.time(stage=direction):
+        sent = await send
+    TRANSFER_BYTES.inc(size, direction=direction)
+    TRANSFER_SECONDS.inc(time.monotonic() - started, direction=direction)
+    return sent
+
+async def send_file(job: Job, filepath: str):
+    """Upload a downloaded file from disk."""
+    artist, title = job.state["artist"], job.state["title"]
+    return await timed_send("upload", os.path.getsize(filepath), job.message.answer_audio(
+        audio=FSInputFile(filepath),
+        caption=f"{artist} - {title}",
+        title=title,
+        performer=artist
+    ))
+
+async def send_streamed(job: Job):
+    """Upload straight from the CDN, teeing into the library if enabled."""
+    downloadable, filepath, size = job.state["stream"]
+    artist, title = job.state["artist"], job.state["title"]
+    audio = StreamInputFile(
+        downloadable,
+        os.path.basename(filepath),
+        size,
+        buffer_size=config.STREAM_BUFFER,
+        tee_path=filepath if config.STREAM_TEE else None,
+    )
+    sent = await timed_send("stream", size, job.message.answer_audio(
+        audio=audio,
+        caption=f"{artist} - {title}",
+        title=title,
+        performer=artist
+    ))
+    if audio.teed:
+        # Telegram got the raw stream; the library copy gets its tags afterwards
+        await tidal_client.tag_track(filepath, job.state["track_info"])
+        quality = job.state["key"][1]
+        await library.add(job.track_id, quality, filepath, artist, title)
+        await planner.remember(job.track_id, quality, os.path.getsize(filepath))
+    return sent
+
+async def upload_stage(job: Job):
+    """Send a downloaded track to the user who asked for it."""
+    message, status_msg, track_id = job.message, job.status_msg, job.track_id
+    artist, title = job.state["artist"], job.state["title"]
+    stack = job.state["stack"]
+    
+    try:
+        # Send file
+        await status_msg.edit_text("📤 Sending file...")
         
-        # Send as audio with caption
-        await message.answer_audio(
-            audio=audio_file,
-            caption=f"{artist} - {title}",
-            title=title,
-            performer=artist
-        )
+        if "stream" in job.state:
+            try:
+                await deliver(job, lambda: send_streamed(job))
+                job.state["filepath"] = None
+            except Exception as e:
+                # Fall back to a regular download; the resolved URL is reused
+                logger.warning(f"Streaming upload of track {track_id} failed, using disk: {e}")
+                await status_msg.edit_text(f"⬇️ Downloading: {artist} - {title}")
+                filepath = await stack.enter_async_context(
+                    downloads.join(job.state["key"], job.state["fetch"], cleanup=release_track)
+                )
+                if not filepath or not os.path.exists(filepath):
+                    await status_msg.edit_text(f"❌ Failed to download track {track_id}")
+                    return
+                job.state["filepath"] = filepath
+                await status_msg.edit_text("📤 Sending file...")
+                
+        if job.state["filepath"]:
+            filepath = job.state["filepath"]
+            await deliver(job, lambda: send_file(job, filepath))
         
+        STAGE_SECONDS.observe(time.monotonic() - job.queued_at, stage="total")
         await status_msg.delete()
         await bot.send_message(config.ADMIN_ID, f"Bot used by {message.from_user.id} :) | {artist} - {title}")
-        # Clean up file after sending (optional)
-        os.remove(filepath)
         
     except Exception as e:
         logger.error(f"Error processing track {track_id}: {e}")
         await status_msg.edit_text(f"❌ Error: {str(e)}")
+    finally:
+        await stack.aclose()
+
+# Download/upload worker pools fed round-robin across users
+scheduler = Scheduler(
+    download_stage,
+    upload_stage,
+    show_position,
+    download_workers=config.DOWNLOAD_WORKERS,
+    upload_workers=config.UPLOAD_WORKERS,
+    max_depth=config.MAX_QUEUE,
+    max_per_user=config.MAX_USER_QUEUE,
+    update_interval=config.QUEUE_UPDATE_INTERVAL,
+)
+
+async def renew_lease(job_id: int, owner: str):
+    while True:
+        await asyncio.sleep(config.JOB_LEASE / 3)
+        if not await jobs.renew(job_id, owner, config.JOB_LEASE):
+            logger.warning(f"Lost the lease on job {job_id}")
+            return
+
+async def run_claimed(queued: QueuedJob, owner: str):
+    """Worker process: take one queued job through the download and upload stages."""
+    message = Message.model_validate(queued.payload["message"], context={"bot": bot})
+    status_msg = Message.model_validate(queued.payload["status"], context={"bot": bot})
+    job = Job(queued.user_id, queued.track_id, message, status_msg)
+    job.queued_at = time.monotonic() - (time.time() - queued.created)
+    
+    renewer = asyncio.create_task(renew_lease(queued.id, owner))
+    try:
+        if queued.attempts > config.JOB_MAX_ATTEMPTS:
+            # Every worker that took this job died with it
+            logger.error(f"Dropping track {queued.track_id} after {queued.attempts - 1} attempts")
+            await status_msg.edit_text(f"❌ Failed to download track {queued.track_id}")
+        elif await send_cached(message, queued.track_id):
+            # Another worker uploaded the same track while this one waited
+            await status_msg.delete()
+        elif await download_stage(job):
+            await upload_stage(job)
+        await jobs.finish(queued.id, owner)
+    except asyncio.CancelledError:
+        await asyncio.shield(jobs.release(queued.id, owner))
+        raise
+    except Exception as e:
+        # Left to its lease: another attempt follows once it runs out
+        logger.error(f"Job {queued.id} for track {queued.track_id} failed: {e}")
+    finally:
+        renewer.cancel()
+
+async def job_slot(owner: str):
+    while True:
+        try:
+            queued = await jobs.claim(owner, config.JOB_LEASE)
+        except Exception as e:
+            logger.warning(f"Job queue unavailable: {e}")
+            queued = None
+        if queued is None:
+            await asyncio.sleep(config.JOB_POLL_INTERVAL)
+            continue
+        await run_claimed(queued, owner)
+
+async def publish_stats(index: int):
+    """Leave this worker's metrics where the front process's /stats finds them."""
+    while True:
+        await asyncio.sleep(config.STATS_PUBLISH_INTERVAL)
+        try:
+            await worker_stats.publish(index, metrics.snapshot())
+        except Exception as e:
+            logger.warning(f"Could not publish worker stats: {e}")
+
+async def worker_main(index: int):
+    """Entry point of one worker process: run queued jobs until SIGTERM."""
+    global worker_index
+    worker_index = index
+    owner = f"worker{index}:{os.getpid()}"
+    await startup(notify=False)
+    metrics_runner = None
+    if config.METRICS_PORT:
+        # The front process has METRICS_PORT, worker i gets the next port + i
+        port = config.METRICS_PORT + 1 + index
+        metrics_runner = await metrics.serve(config.METRICS_HOST, port)
+        
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+        
+    slots = [asyncio.create_task(job_slot(owner)) for _ in range(config.DOWNLOAD_WORKERS)]
+    publisher = asyncio.create_task(publish_stats(index))
+    logger.info(f"Worker {index} running {len(slots)} job slots")
+    try:
+        await stop.wait()
+    finally:
+        # Cancelled jobs go back to the queue for the next worker
+        for slot in slots:
+            slot.cancel()
+        await asyncio.gather(*slots, return_exceptions=True)
+        publisher.cancel()
+        try:
+            await worker_stats.publish(index, metrics.snapshot())
+        except Exception as e:
+            logger.warning(f"Could not publish worker stats: {e}")
+        await worker_stats.close()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        if tidal_client:
+            await tidal_client.close()
+        await sessions.close()
+        await jobs.close()
+        await bot.session.close()
+
+async def run_webhook():
+    """Serve updates pushed by Telegram until SIGINT or SIGTERM."""
+    if not config.WEBHOOK_URL:
+        raise RuntimeError("UPDATE_MODE=webhook needs WEBHOOK_URL")
+    server = WebhookServer(dp, bot, config.WEBHOOK_SECRET or secrets.token_urlsafe(32),
+                           config.WEBHOOK_MAX_CONCURRENT)
+    metrics.Gauge("tidalbot_webhook_updates_active", "Updates being handled",
+                  lambda: server.in_flight)
+    
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+        
+    await server.start(config.WEBHOOK_HOST, config.WEBHOOK_PORT, config.WEBHOOK_PATH,
+                       config.WEBHOOK_URL)
+    try:
+        await stop.wait()
+    finally:
+        await server.stop()
+        await bot.session.close()
 
 async def main():
     """Main function."""
     await startup()
+    positions = None
+    if workers:
+        await worker_stats.clear()  # snapshots from an earlier run
+        workers.start()
+        positions = asyncio.create_task(update_positions())
+    else:
+        scheduler.start()
+    metrics_runner = None
+    if config.METRICS_PORT:
+        metrics_runner = await metrics.serve(config.METRICS_HOST, config.METRICS_PORT)
+        logger.info(f"Metrics at http://{config.METRICS_HOST}:{config.METRICS_PORT}/metrics")
     
-    # Start polling
     logger.info("Starting bot...")
-    await dp.start_polling(bot)
+    try:
+        if config.UPDATE_MODE == "webhook":
+            await run_webhook()
+        else:
+            # A webhook left over from webhook mode would make getUpdates fail
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
+    finally:
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        if workers:
+            positions.cancel()
+            await workers.stop()
+            await worker_stats.close()
+        else:
+            await scheduler.stop()
+        if tidal_client:
+            await tidal_client.close()  # stops the token refresher
+        await sessions.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    if sys.argv[1:2] == ["worker"]:
+        asyncio.run(worker_main(int(sys.argv[2])))
+    else:
+        asyncio.run(main())
\ No newline at end of file
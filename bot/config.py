@@ -7,6 +7,7 @@ from dotenv import load_dotenv
 load_dotenv()
 
 TOKENS_FILE = "tidal_tokens.json"
+ACCOUNTS_FILE = "tidal_accounts.json"  # replaces TOKENS_FILE once a pool is saved
 
 @dataclass
 class TidalTokens:
@@ -23,7 +24,75 @@ class Config:
     
     # Download settings
     DOWNLOAD_FOLDER: str = "downloads"
-    QUALITY: int = 2  # 2 = FLAC
+    QUALITY: int = 2  # 2 = FLAC; the best tried, lower ones when it won't fit UPLOAD_LIMIT
+    UPLOAD_LIMIT: int = int(os.getenv("UPLOAD_LIMIT", 0))  # bytes; 0 = Telegram's (50 MB, 2000 MB with TELEGRAM_API_URL)
+    TAG_MARGIN: int = 1024 ** 2  # bytes kept free under UPLOAD_LIMIT for tags and album art
+    CHUNK_SIZE: int = 64 * 1024  # network read size
+    WRITE_BUFFER_SIZE: int = 1024 * 1024  # bytes accumulated per disk write
+    DOWNLOAD_RETRIES: int = 3  # resumed attempts after a dropped connection
+    DASH_WINDOW: int = 4  # DASH segments fetched ahead of the writer
+    PROGRESS_INTERVAL: float = 3.0  # seconds between status edits; Telegram throttles faster edits
+    REQUESTS_PER_MINUTE: int = 100  # Tidal API budget shared by all calls
+    TOKEN_REFRESH_MARGIN: int = 3600  # seconds before expiry the token is renewed
+    
+    # Connection pool settings
+    VERIFY_SSL: bool = True
+    API_CONNECTIONS: int = 10  # pool shared by auth and API calls
+    CDN_CONNECTIONS: int = 32  # separate pool for CDN transfers
+    CDN_CONNECTIONS_PER_HOST: int = 8
+    KEEPALIVE_TIMEOUT: float = 60  # seconds an idle connection is kept
+    DNS_CACHE_TTL: int = 300  # seconds
+    
+    # Cache settings
+    CACHE_DB: str = "cache.db"  # SQLite file shared by the persistent caches
+    METADATA_CACHE_SIZE: int = 1024  # in-memory LRU entries
+    METADATA_TTL: int = 7 * 24 * 3600  # seconds
+    MANIFEST_CACHE_SIZE: int = 256  # resolved playback manifests kept in memory
+    MANIFEST_TTL: int = 600  # seconds, for URLs without a signed expiry
+    
+    # Tags and album art written into downloaded files
+    TAG_FILES: bool = True
+    COVER_SIZE: int = 1280  # pixels, one of Tidal's square image sizes
+    COVER_CACHE_BYTES: int = 32 * 1024 ** 2  # album art kept in memory
+    LIBRARY_MAX_BYTES: int = 2 * 1024 ** 3  # downloaded files kept for repeat requests
+    
+    # Job queue settings
+    DOWNLOAD_WORKERS: int = 3
+    UPLOAD_WORKERS: int = 2
+    MAX_QUEUE: int = 100  # jobs waiting across all users
+    MAX_USER_QUEUE: int = 20  # jobs waiting per user
+    QUEUE_UPDATE_INTERVAL: float = 5.0  # seconds between position updates
+    
+    # Worker processes: 0 downloads and uploads in this process. With N > 0
+    # this process only takes updates and queues jobs in CACHE_DB, and N
+    # worker processes (each with DOWNLOAD_WORKERS job slots) run them
+    WORKER_PROCESSES: int = int(os.getenv("WORKER_PROCESSES", 0))
+    JOB_LEASE: float = 60.0  # seconds a worker holds a job without renewing it
+    JOB_POLL_INTERVAL: float = 0.5  # seconds an idle worker waits before claiming again
+    JOB_MAX_ATTEMPTS: int = 3  # claims before a job that keeps killing workers is dropped
+    STATS_PUBLISH_INTERVAL: float = 10.0  # seconds between a worker's metric snapshots for /stats
+    
+    # Streaming delivery: pipe the CDN body straight into the Telegram upload
+    STREAM_UPLOADS: bool = False
+    STREAM_MAX_SIZE: int = 50 * 1024 ** 2  # larger or unknown sizes go through disk
+    STREAM_BUFFER: int = 4 * 1024 ** 2  # bytes held between CDN and upload
+    STREAM_TEE: bool = True  # also keep a copy in the library
+    
+    # Prometheus endpoint at http://METRICS_HOST:METRICS_PORT/metrics
+    METRICS_HOST: str = "127.0.0.1"
+    METRICS_PORT: int = 0  # 0 disables the endpoint; /stats still works
+    
+    # Update delivery: "polling", or "webhook" to have Telegram POST updates to us
+    UPDATE_MODE: str = os.getenv("UPDATE_MODE", "polling")
+    WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", "")  # public HTTPS URL that reaches WEBHOOK_PATH
+    WEBHOOK_PATH: str = "/telegram"
+    WEBHOOK_HOST: str = "0.0.0.0"
+    WEBHOOK_PORT: int = int(os.getenv("WEBHOOK_PORT", 8080))
+    WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET", "")  # random per start if empty
+    WEBHOOK_MAX_CONCURRENT: int = 40  # updates handled at once; more wait for a slot
+    
+    # Bot API base URL, e.g. a local Bot API server or a fake one for tests
+    TELEGRAM_API_URL: str = os.getenv("TELEGRAM_API_URL", "")
     
     def __post_init__(self):
         # Create downloads folder
@@ -44,4 +113,22 @@ class Config:
                     return TidalTokens(**data)
             except Exception as e:
                 print(f"Error loading tokens: {e}")
-        return TidalTokens()
\ No newline at end of file
+        return TidalTokens()
+        
+    def save_accounts(self, accounts: list[TidalTokens]):
+        """Save every pooled account's tokens to one file."""
+        tmp = ACCOUNTS_FILE + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump([asdict(tokens) for tokens in accounts], f)
+        os.replace(tmp, ACCOUNTS_FILE)
+        
+    def load_accounts(self) -> list[TidalTokens]:
+        """Load pooled accounts, falling back to the single-account tokens file."""
+        if os.path.exists(ACCOUNTS_FILE):
+            try:
+                with open(ACCOUNTS_FILE, 'r') as f:
+                    return [TidalTokens(**data) for data in json.load(f)]
+            except Exception as e:
+                print(f"Error loading accounts: {e}")
+        tokens = self.load_tokens()
+        return [tokens] if tokens.refresh_token or tokens.access_token else []
\ No newline at end of file
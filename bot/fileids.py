@@ -0,0 +1,79 @@
+"""Persistent map from (track_id, quality) to an uploaded Telegram file_id."""
+
+import time
+from typing import Optional
+
+from store import SQLiteStore
+
+class FileIdCache(SQLiteStore):
+    """Remembers Telegram audio file_ids so repeat requests skip Tidal and the upload."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS file_ids (
+            track_id TEXT NOT NULL,
+            quality INTEGER NOT NULL,
+            file_id TEXT NOT NULL,
+            caption TEXT NOT NULL,
+            created REAL NOT NULL,
+            PRIMARY KEY (track_id, quality)
+        );
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, track_id: str, quality: int) -> Optional[tuple[str, str]]:
+        """Return (file_id, caption) or None."""
+        row = await self._run(self._select, track_id, quality)
+        if row is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return row
+
+    async def best(self, track_id: str, max_quality: int) -> Optional[tuple[int, str, str]]:
+        """Return (quality, file_id, caption) for the highest quality up to max_quality, or None."""
+        row = await self._run(self._select_best, track_id, max_quality)
+        if row is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return row
+
+    async def set(self, track_id: str, quality: int, file_id: str, caption: str):
+        await self._run(self._insert, track_id, quality, file_id, caption)
+
+    async def invalidate(self, track_id: str, quality: int):
+        """Forget a file_id Telegram no longer accepts."""
+        await self._run(self._delete, track_id, quality)
+
+    def _select(self, track_id: str, quality: int):
+        return self._connect().execute(
+            "SELECT file_id, caption FROM file_ids WHERE track_id = ? AND quality = ?",
+            (track_id, quality),
+        ).fetchone()
+
+    def _select_best(self, track_id: str, max_quality: int):
+        return self._connect().execute(
+            "SELECT quality, file_id, caption FROM file_ids WHERE track_id = ? AND quality <= ? "
+            "ORDER BY quality DESC LIMIT 1",
+            (track_id, max_quality),
+        ).fetchone()
+
+    def _insert(self, track_id: str, quality: int, file_id: str, caption: str):
+        db = self._connect()
+        with db:
+            db.execute(
+                "INSERT OR REPLACE INTO file_ids (track_id, quality, file_id, caption, created) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (track_id, quality, file_id, caption, time.time()),
+            )
+
+    def _delete(self, track_id: str, quality: int):
+        db = self._connect()
+        with db:
+            db.execute(
+                "DELETE FROM file_ids WHERE track_id = ? AND quality = ?", (track_id, quality)
+            )
@@ -0,0 +1,198 @@
+"""Durable job queue shared by the front process and worker processes."""
+
+import json
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from scheduler import QueueFull
+from store import SQLiteStore
+
+# Waiting and expired jobs in claim order, round-robin across users like
+# the in-process Scheduler: a user's n-th waiting job gets turn n, pushed
+# back by however many of their jobs are already running
+CLAIM_ORDER = """
+    WITH running AS (
+        SELECT user_id, COUNT(*) AS jobs FROM jobs
+        WHERE owner IS NOT NULL AND lease_expires >= :now GROUP BY user_id
+    ), ranked AS (
+        SELECT id, user_id, track_id, payload, attempts, created,
+               ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY id)
+               + COALESCE((SELECT jobs FROM running WHERE running.user_id = jobs.user_id), 0) AS turn
+        FROM jobs WHERE owner IS NULL OR lease_expires < :now
+    )
+    SELECT id, user_id, track_id, payload, attempts, created FROM ranked
+"""
+
+@dataclass
+class QueuedJob:
+    id: int
+    user_id: int
+    track_id: str
+    payload: dict
+    attempts: int  # claims so far, including the current one
+    created: float  # wall clock, comparable across processes
+
+class JobQueue(SQLiteStore):
+    """Track requests in a SQLite table that worker processes claim under a lease.
+
+    A worker renews its lease while it runs a job. If the worker dies, the
+    lease runs out and another worker picks the job up again, so every job
+    is delivered at least once. A track that is running in one worker is
+    not handed to another, so two processes never download the same file
+    at once; the later request then hits the library or file_id cache.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            track_id TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            owner TEXT,
+            lease_expires REAL NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_user ON jobs (user_id, id);
+    """
+
+    async def check(self, user_id: int, max_depth: int, max_per_user: int):
+        """Raise QueueFull if a job from this user would be rejected."""
+        await self._run(self._check, user_id, max_depth, max_per_user)
+
+    async def put(self, user_id: int, track_id: str, payload: dict,
+                  max_depth: int, max_per_user: int) -> tuple[int, int]:
+        """Queue a job; returns (job id, position) or raises QueueFull."""
+        return await self._run(self._put, user_id, track_id, json.dumps(payload),
+                               max_depth, max_per_user)
+
+    async def claim(self, owner: str, lease: float) -> Optional[QueuedJob]:
+        """Take the next job for owner, or None if nothing is claimable."""
+        return await self._run(self._claim, owner, lease)
+
+    async def renew(self, job_id: int, owner: str, lease: float) -> bool:
+        """Extend a lease; False if the job was given to someone else meanwhile."""
+        return await self._run(self._update, job_id, owner,
+                               "lease_expires = ?", (time.time() + lease,))
+
+    async def finish(self, job_id: int, owner: str):
+        await self._run(self._update, job_id, owner, None, ())
+
+    async def release(self, job_id: int, owner: str):
+        """Hand an unfinished job back without counting the attempt, e.g. on shutdown."""
+        await self._run(self._update, job_id, owner,
+                        "owner = NULL, lease_expires = 0, attempts = attempts - 1", ())
+
+    async def waiting(self) -> list[QueuedJob]:
+        """Jobs nobody holds a lease on, in the order they will be claimed."""
+        return await self._run(self._waiting)
+
+    async def running_tracks(self) -> set[str]:
+        return await self._run(self._running_tracks)
+
+    async def counts(self) -> tuple[int, int]:
+        """(waiting, running) job counts."""
+        return await self._run(self._counts)
+
+    def _connect(self):
+        if self._db is None:
+            db = super()._connect()
+            # Readers in other processes don't block the writer and vice versa
+            db.execute("PRAGMA journal_mode = WAL")
+        return self._db
+
+    def _check(self, user_id: int, max_depth: int, max_per_user: int):
+        db = self._connect()
+        now = time.time()
+        depth = db.execute(
+            "SELECT COUNT(*) FROM jobs WHERE owner IS NULL OR lease_expires < ?", (now,)
+        ).fetchone()[0]
+        if depth >= max_depth:
+            raise QueueFull("The queue is full right now, please try again in a few minutes.")
+        queued = db.execute(
+            "SELECT COUNT(*) FROM jobs WHERE user_id = ? AND (owner IS NULL OR lease_expires < ?)",
+            (user_id, now),
+        ).fetchone()[0]
+        if queued >= max_per_user:
+            raise QueueFull(f"You already have {queued} tracks queued, please wait for them first.")
+
+    def _put(self, user_id: int, track_id: str, payload: str,
+             max_depth: int, max_per_user: int) -> tuple[int, int]:
+        db = self._connect()
+        with self._transaction(db):
+            self._check(user_id, max_depth, max_per_user)
+            job_id = db.execute(
+                "INSERT INTO jobs (user_id, track_id, payload, created) VALUES (?, ?, ?, ?)",
+                (user_id, track_id, payload, time.time()),
+            ).lastrowid
+        position = [job.id for job in self._waiting()].index(job_id) + 1
+        return job_id, position
+
+    def _claim(self, owner: str, lease: float) -> Optional[QueuedJob]:
+        db = self._connect()
+        now = time.time()
+        with self._transaction(db):
+            row = db.execute(
+                CLAIM_ORDER + """
+                WHERE track_id NOT IN (
+                    SELECT track_id FROM jobs WHERE owner IS NOT NULL AND lease_expires >= :now
+                )
+                ORDER BY turn, id LIMIT 1
+                """,
+                {"now": now},
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE jobs SET owner = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                (owner, now + lease, row[0]),
+            )
+        job = self._job(row)
+        job.attempts += 1
+        return job
+
+    def _update(self, job_id: int, owner: str, assignments: Optional[str], values: tuple) -> bool:
+        """Change or, without assignments, delete a job this owner still holds."""
+        db = self._connect()
+        with db:
+            if assignments is None:
+                cursor = db.execute("DELETE FROM jobs WHERE id = ? AND owner = ?", (job_id, owner))
+            else:
+                cursor = db.execute(
+                    f"UPDATE jobs SET {assignments} WHERE id = ? AND owner = ?",
+                    (*values, job_id, owner),
+                )
+        return cursor.rowcount == 1
+
+    def _waiting(self) -> list[QueuedJob]:
+        rows = self._connect().execute(
+            CLAIM_ORDER + " ORDER BY turn, id", {"now": time.time()}
+        ).fetchall()
+        return [self._job(row) for row in rows]
+
+    def _running_tracks(self) -> set[str]:
+        rows = self._connect().execute(
+            "SELECT DISTINCT track_id FROM jobs WHERE owner IS NOT NULL AND lease_expires >= ?",
+            (time.time(),),
+        ).fetchall()
+        return {row[0] for row in rows}
+
+    def _counts(self) -> tuple[int, int]:
+        waiting, running = self._connect().execute(
+            "SELECT COALESCE(SUM(owner IS NULL OR lease_expires < :now), 0), "
+            "COALESCE(SUM(owner IS NOT NULL AND lease_expires >= :now), 0) FROM jobs",
+            {"now": time.time()},
+        ).fetchone()
+        return waiting, running
+
+    @staticmethod
+    def _job(row) -> QueuedJob:
+        job_id, user_id, track_id, payload, attempts, created = row
+        return QueuedJob(job_id, user_id, track_id, json.loads(payload), attempts, created)
+
+    @staticmethod
+    def _transaction(db):
+        """Write lock up front, so a check-then-write can't race another process."""
+        db.execute("BEGIN IMMEDIATE")
+        return db
@@ -0,0 +1,149 @@
+"""Local library of downloaded tracks, indexed by track_id and quality."""
+
+import os
+import time
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from common.integrity import remove, verified
+from store import SQLiteStore
+
+@dataclass
+class LibraryEntry:
+    path: str
+    size: int
+    artist: str
+    title: str
+
+class Library(SQLiteStore):
+    """Index of files in the download folder, held under a byte budget.
+
+    A hit needs no Tidal API call at all. When the total size goes over
+    max_bytes the least recently used files are deleted, except for the
+    keys passed as pinned (tracks that are still being sent).
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS library (
+            track_id TEXT NOT NULL,
+            quality INTEGER NOT NULL,
+            path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            artist TEXT NOT NULL,
+            title TEXT NOT NULL,
+            last_access REAL NOT NULL,
+            PRIMARY KEY (track_id, quality)
+        );
+        CREATE INDEX IF NOT EXISTS library_last_access ON library (last_access);
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        super().__init__(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, track_id: str, quality: int) -> Optional[LibraryEntry]:
+        """Look up a track and mark it as recently used."""
+        entry = await self._run(self._get, track_id, quality)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    async def best(self, track_id: str, max_quality: int,
+                   max_size: int) -> Optional[tuple[int, LibraryEntry]]:
+        """Highest quality up to max_quality held for a track in at most max_size bytes."""
+        found = await self._run(self._best, track_id, max_quality, max_size)
+        if found is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return found
+
+    async def add(self, track_id: str, quality: int, path: str, artist: str, title: str):
+        await self._run(self._add, track_id, quality, path, artist, title)
+
+    async def evict(self, pinned: Iterable[tuple] = ()) -> int:
+        """Delete least recently used files until under budget; returns bytes freed."""
+        return await self._run(self._evict, self.max_bytes, set(pinned))
+
+    async def clear(self, pinned: Iterable[tuple] = ()) -> int:
+        """Delete every indexed file that isn't pinned; returns bytes freed."""
+        return await self._run(self._evict, 0, set(pinned))
+
+    async def stats(self) -> dict:
+        count, total = await self._run(self._totals)
+        return {"files": count, "bytes": total, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses}
+
+    def _get(self, track_id: str, quality: int) -> Optional[LibraryEntry]:
+        db = self._connect()
+        row = db.execute(
+            "SELECT path, size, artist, title FROM library WHERE track_id = ? AND quality = ?",
+            (track_id, quality),
+        ).fetchone()
+        if row is None:
+            return None
+        with db:
+            if not verified(row[0]):
+                # Deleted behind our back, or never confirmed complete
+                db.execute(
+                    "DELETE FROM library WHERE track_id = ? AND quality = ?", (track_id, quality)
+                )
+                return None
+            db.execute(
+                "UPDATE library SET last_access = ? WHERE track_id = ? AND quality = ?",
+                (time.time(), track_id, quality),
+            )
+        return LibraryEntry(*row)
+
+    def _best(self, track_id: str, max_quality: int,
+              max_size: int) -> Optional[tuple[int, LibraryEntry]]:
+        rows = self._connect().execute(
+            "SELECT quality FROM library WHERE track_id = ? AND quality <= ? AND size <= ? "
+            "ORDER BY quality DESC",
+            (track_id, max_quality, max_size),
+        ).fetchall()
+        for (quality,) in rows:
+            entry = self._get(track_id, quality)
+            if entry is not None:
+                return quality, entry
+        return None
+
+    def _add(self, track_id: str, quality: int, path: str, artist: str, title: str):
+        db = self._connect()
+        with db:
+            db.execute(
+                "INSERT OR REPLACE INTO library "
+                "(track_id, quality, path, size, artist, title, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (track_id, quality, path, os.path.getsize(path), artist, title, time.time()),
+            )
+
+    def _totals(self) -> tuple[int, int]:
+        count, total = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM library"
+        ).fetchone()
+        return count, total
+
+    def _evict(self, budget: int, pinned: set) -> int:
+        db = self._connect()
+        _, total = self._totals()
+        freed = 0
+        rows = db.execute(
+            "SELECT track_id, quality, path, size FROM library ORDER BY last_access"
+        ).fetchall()
+        with db:
+            for track_id, quality, path, size in rows:
+                if total - freed <= budget:
+                    break
+                if (track_id, quality) in pinned:
+                    continue
+                remove(path)
+                db.execute(
+                    "DELETE FROM library WHERE track_id = ? AND quality = ?", (track_id, quality)
+                )
+                freed += size
+        return freed
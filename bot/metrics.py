@@ -0,0 +1,232 @@
+"""Per-stage latency and throughput metrics with a Prometheus text endpoint."""
+
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable, Optional, Union
+
+from aiohttp import web
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+REGISTRY: list = []
+
+def _labels(names: tuple, values: dict) -> tuple:
+    return tuple(str(values.get(name, "")) for name in names)
+
+def _summed(exported: Iterable[list], snapshots: Iterable[dict], name: str) -> dict:
+    """Add up exported series, ours and those under name in other processes' snapshots."""
+    total: dict = {}
+    for key, value in [*exported, *(item for snapshot in snapshots for item in snapshot.get(name, ()))]:
+        key = tuple(key)
+        if isinstance(value, list):
+            current = total.get(key, [0] * len(value))
+            total[key] = [a + b for a, b in zip(current, value)]
+        else:
+            total[key] = total.get(key, 0) + value
+    return total
+
+def _format(name: str, names: tuple, key: tuple, value: float, extra: str = "") -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, key)]
+    if extra:
+        pairs.append(extra)
+    labels = "{" + ",".join(pairs) + "}" if pairs else ""
+    return f"{name}{labels} {value if isinstance(value, int) else repr(float(value))}"
+
+class Histogram:
+    """Cumulative-bucket histogram, one series per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS,
+                 register: bool = True):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}  # key -> [count per bucket..., +Inf, sum]
+        if register:
+            REGISTRY.append(self)
+
+    def observe(self, value: float, **labels):
+        series = self._series.setdefault(_labels(self.labels, labels), [0] * (len(self.buckets) + 2))
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the block took, whether or not it raised."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start, **labels)
+
+    def summary(self, **labels) -> Optional[dict]:
+        """Count, mean and estimated p50/p95 for one label set."""
+        series = self._series.get(_labels(self.labels, labels))
+        if not series:
+            return None
+        count = sum(series[:-1])
+        return {
+            "count": count,
+            "mean": series[-1] / count,
+            "p50": self._quantile(series, 0.5),
+            "p95": self._quantile(series, 0.95),
+        }
+
+    def _quantile(self, series: list, q: float) -> float:
+        """Linear interpolation inside the bucket holding the q-th observation."""
+        rank = q * sum(series[:-1])
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets, series):
+            if count and seen + count >= rank:
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return self.buckets[-1]
+
+    def keys(self) -> list[dict]:
+        return [dict(zip(self.labels, key)) for key in self._series]
+
+    def export(self) -> list:
+        return [[list(key), series] for key, series in self._series.items()]
+
+    def combined(self, snapshots: Iterable[dict]) -> "Histogram":
+        """An unregistered copy that also counts the series in other processes' snapshots."""
+        total = Histogram(self.name, self.help, self.labels, self.buckets, register=False)
+        total._series = _summed(self.export(), snapshots, self.name)
+        return total
+
+    def render(self) -> Iterable[str]:
+        for key, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield _format(f"{self.name}_bucket", self.labels, key, cumulative, f'le="{bound:g}"')
+            cumulative += series[-2]
+            yield _format(f"{self.name}_bucket", self.labels, key, cumulative, 'le="+Inf"')
+            yield _format(f"{self.name}_sum", self.labels, key, series[-1])
+            yield _format(f"{self.name}_count", self.labels, key, cumulative)
+
+class Counter:
+    """Monotonic total, one series per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), register: bool = True):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+        if register:
+            REGISTRY.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = _labels(self.labels, labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(_labels(self.labels, labels), 0)
+
+    def items(self) -> Iterable[tuple[dict, float]]:
+        for key, value in self._values.items():
+            yield dict(zip(self.labels, key)), value
+
+    def export(self) -> list:
+        return [[list(key), value] for key, value in self._values.items()]
+
+    def combined(self, snapshots: Iterable[dict]) -> "Counter":
+        """An unregistered copy that also counts the totals in other processes' snapshots."""
+        total = Counter(self.name, self.help, self.labels, register=False)
+        total._values = _summed(self.export(), snapshots, self.name)
+        return total
+
+    def render(self) -> Iterable[str]:
+        for key, value in self._values.items():
+            yield _format(self.name, self.labels, key, value)
+
+class Gauge:
+    """Value read from a callback at scrape time.
+
+    The callback returns a number, or (labels, value) pairs for labelled
+    series. kind can be set to "counter" for totals kept elsewhere.
+    """
+
+    def __init__(self, name: str, help: str, read: Callable[[], Union[float, Iterable[tuple]]],
+                 labels: tuple = (), kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.labels = labels
+        self.kind = kind
+        REGISTRY.append(self)
+
+    def render(self) -> Iterable[str]:
+        values = self.read()
+        if not self.labels:
+            yield _format(self.name, (), (), values)
+            return
+        for labels, value in values:
+            yield _format(self.name, self.labels, _labels(self.labels, labels), value)
+
+    def export(self) -> list:
+        if not self.labels:
+            return [[[], self.read()]]
+        return [[list(_labels(self.labels, labels)), value] for labels, value in self.read()]
+
+    def combined(self, snapshots: Iterable[dict]) -> Counter:
+        """For kind="counter": a Counter of our totals plus other processes' snapshots."""
+        total = Counter(self.name, self.help, self.labels, register=False)
+        total._values = _summed(self.export(), snapshots, self.name)
+        return total
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        try:
+            lines.extend(metric.render())
+        except Exception as e:
+            # A broken callback must not take the whole scrape down
+            lines.append(f"# {metric.name} unavailable: {e}")
+    return "\n".join(lines) + "\n"
+
+def snapshot() -> dict:
+    """This process's histograms and totals, JSON-ready, for another process to add up."""
+    exported = {}
+    for metric in REGISTRY:
+        if metric.kind not in ("histogram", "counter"):
+            continue
+        try:
+            exported[metric.name] = metric.export()
+        except Exception:
+            pass  # a broken callback only loses its own metric, as in render()
+    return exported
+
+async def serve(host: str, port: int) -> web.AppRunner:
+    """Serve GET /metrics; the caller cleans up the returned runner."""
+    async def metrics(request: web.Request) -> web.Response:
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+# Time per stage of a track request: metadata, planning, playbackinfo, cdn, upload,
+# stream (CDN piped into the upload), tagging, queue_wait, cached_reply and total
+STAGE_SECONDS = Histogram("tidalbot_stage_seconds", "Time spent in each request stage", ("stage",))
+
+# Bytes and wall time per transfer direction; bytes/sec is their ratio
+TRANSFER_BYTES = Counter("tidalbot_transfer_bytes_total", "Bytes transferred", ("direction",))
+TRANSFER_SECONDS = Counter("tidalbot_transfer_seconds_total", "Time spent transferring", ("direction",))
+
+# Webhook deliveries by outcome: accepted, unauthorized or invalid
+WEBHOOK_UPDATES = Counter("tidalbot_webhook_updates_total", "Webhook requests by outcome", ("result",))
@@ -0,0 +1,96 @@
+"""Pick the best quality whose file Telegram will accept, before downloading it."""
+
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from common.downloadable import Downloadable
+from sizes import TrackSizes
+from tidal_client import QUALITY_MAP
+
+logger = logging.getLogger(__name__)
+
+BOT_API_UPLOAD_LIMIT = 50 * 1024 ** 2  # sendAudio through api.telegram.org
+LOCAL_API_UPLOAD_LIMIT = 2000 * 1024 ** 2  # through a local Bot API server
+
+# Bitrate range in kbit/s a track of each quality lands in. The high end
+# is the format's ceiling: a file that fits even there needs no probe. The
+# low end is well under what real tracks reach: a file that can't fit even
+# there is skipped without one.
+BITRATES = {
+    0: (64, 104),  # AAC 96 in MP4
+    1: (256, 336),  # AAC 320 in MP4
+    2: (400, 1440),  # FLAC 16/44.1: 1411 kbit/s PCM when incompressible, plus frame headers
+    3: (700, 4700),  # MQA or FLAC up to 24/96: 4608 kbit/s PCM, plus frame headers
+}
+
+QUALITIES = {name: quality for quality, name in QUALITY_MAP.items()}
+
+@dataclass
+class Plan:
+    quality: int
+    size: int  # bytes; exact if probed or remembered, else the high estimate, 0 if unknown
+    resolved: Optional[tuple[Downloadable, str]] = None  # resolve_track() result from a probe
+
+class QualityPlanner:
+    """Choose the best quality up to the preferred one that fits max_size.
+
+    Each candidate is judged on the cheapest evidence that settles it: a
+    size remembered from an earlier probe or download, then duration ×
+    bitrate from the track metadata, and only for borderline tracks a HEAD
+    request for the real Content-Length. margin is kept free for the tags
+    and album art written after the download.
+    """
+
+    def __init__(self, max_size: int, preferred: int, sizes: TrackSizes, margin: int = 0):
+        self.max_size = max_size
+        self.preferred = preferred
+        self.sizes = sizes
+        self.margin = margin
+
+    def fits(self, size: float) -> bool:
+        return size + self.margin <= self.max_size
+
+    def candidates(self, track_info: dict) -> list[int]:
+        """Qualities worth trying, best first; Tidal serves nothing above the track's own."""
+        best = min(self.preferred, QUALITIES.get(track_info.get('audioQuality'), self.preferred))
+        return list(range(best, -1, -1))
+
+    async def plan(self, client, track_id: str, track_info: dict) -> Optional[Plan]:
+        """Best quality that will upload, or None if even the lowest is too large."""
+        duration = track_info.get('duration') or 0
+        for quality in self.candidates(track_info):
+            remembered = await self.sizes.get(track_id, quality)
+            if remembered is not None:
+                if self.fits(remembered):
+                    return Plan(quality, remembered)
+                continue
+
+            low, high = (duration * kbps * 125 for kbps in BITRATES[quality])
+            if duration and self.fits(high):
+                return Plan(quality, int(high))
+            if duration and not self.fits(low):
+                continue
+
+            # Borderline, or no duration to go by: ask the CDN
+            resolved = await client.resolve_track(track_id, quality, track_info)
+            if not resolved:
+                # Leave the failure to the download, as without a planner
+                return Plan(quality, 0)
+            try:
+                size = await resolved[0].size()
+            except Exception as e:
+                logger.warning(f"Size probe for track {track_id} failed: {e}")
+                size = 0
+            if size:
+                await self.sizes.set(track_id, quality, size)
+                if self.fits(size):
+                    return Plan(quality, size, resolved)
+            elif not duration:
+                return Plan(quality, 0, resolved)
+            # DASH streams have no Content-Length; a borderline one may not fit
+        return None
+
+    async def remember(self, track_id: str, quality: int, size: int):
+        """Record the size of a finished download for later plans."""
+        await self.sizes.set(track_id, quality, size)
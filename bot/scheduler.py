@@ -0,0 +1,146 @@
+"""Queue-based download scheduler with per-user fairness."""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+class QueueFull(Exception):
+    """Raised by submit() when a job can't be accepted right now."""
+
+class Job:
+    """One track request moving through the download and upload stages."""
+
+    def __init__(self, user_id: int, track_id: str, message: Any, status_msg: Any):
+        self.user_id = user_id
+        self.track_id = track_id
+        self.message = message
+        self.status_msg = status_msg
+        self.shown_position: Optional[int] = None
+        self.queued_at = time.monotonic()
+        self.state: dict = {}  # filled in by the stage callbacks
+
+class Scheduler:
+    """Fixed pools of download and upload workers fed round-robin across users.
+
+    Each user has their own FIFO; workers take one job from each user in
+    turn, so one user pasting 50 IDs can't starve everyone else. The queue
+    between the stages is bounded, so downloads pause when uploads fall
+    behind. Waiting jobs get their position pushed through on_position.
+    """
+
+    def __init__(self, download: Callable[[Job], Awaitable[bool]],
+                 upload: Callable[[Job], Awaitable[None]],
+                 on_position: Callable[[Job, int], Awaitable[None]],
+                 download_workers: int = 3, upload_workers: int = 2,
+                 max_depth: int = 100, max_per_user: int = 20,
+                 update_interval: float = 5.0):
+        self.download = download
+        self.upload = upload
+        self.on_position = on_position
+        self.download_workers = download_workers
+        self.upload_workers = upload_workers
+        self.max_depth = max_depth
+        self.max_per_user = max_per_user
+        self.update_interval = update_interval
+        self.active = 0  # jobs taken by a worker and not finished yet
+        self._queues: OrderedDict[int, deque[Job]] = OrderedDict()
+        self._ready = asyncio.Event()
+        self._uploads: Optional[asyncio.Queue] = None
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def depth(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def check(self, user_id: int):
+        """Raise QueueFull if a job from this user would be rejected."""
+        if self.depth >= self.max_depth:
+            raise QueueFull("The queue is full right now, please try again in a few minutes.")
+        queued = len(self._queues.get(user_id, ()))
+        if queued >= self.max_per_user:
+            raise QueueFull(f"You already have {queued} tracks queued, please wait for them first.")
+
+    def submit(self, job: Job) -> int:
+        """Queue a job and return its position (1 = next)."""
+        self.check(job.user_id)
+        self._queues.setdefault(job.user_id, deque()).append(job)
+        self._ready.set()
+        job.shown_position = self.position(job)
+        return job.shown_position
+
+    def position(self, job: Job) -> int:
+        """How many jobs the round-robin will hand out before this one, plus one."""
+        users = list(self._queues)
+        mine = users.index(job.user_id)
+        index = self._queues[job.user_id].index(job)
+        ahead = index
+        for order, user in enumerate(users):
+            if user != job.user_id:
+                # Users earlier in the rotation get one extra turn before ours
+                ahead += min(len(self._queues[user]), index + (order < mine))
+        return ahead + 1
+
+    def start(self):
+        self._uploads = asyncio.Queue(maxsize=self.upload_workers * 2)
+        self._tasks = [asyncio.create_task(self._download_worker()) for _ in range(self.download_workers)]
+        self._tasks += [asyncio.create_task(self._upload_worker()) for _ in range(self.upload_workers)]
+        self._tasks.append(asyncio.create_task(self._position_updater()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _next(self) -> Job:
+        while not self._queues:
+            self._ready.clear()
+            await self._ready.wait()
+        user, queue = next(iter(self._queues.items()))
+        job = queue.popleft()
+        # Move this user to the back of the rotation, or drop them when done
+        del self._queues[user]
+        if queue:
+            self._queues[user] = queue
+        return job
+
+    async def _download_worker(self):
+        while True:
+            job = await self._next()
+            self.active += 1
+            try:
+                if await self.download(job):
+                    await self._uploads.put(job)
+                    continue
+            except Exception as e:
+                logger.error(f"Download stage failed for track {job.track_id}: {e}")
+            self.active -= 1
+
+    async def _upload_worker(self):
+        while True:
+            job = await self._uploads.get()
+            try:
+                await self.upload(job)
+            except Exception as e:
+                logger.error(f"Upload stage failed for track {job.track_id}: {e}")
+            finally:
+                self.active -= 1
+
+    async def _position_updater(self):
+        while True:
+            await asyncio.sleep(self.update_interval)
+            for queue in list(self._queues.values()):
+                for job in list(queue):
+                    if job not in queue:
+                        continue  # picked up while we were editing messages
+                    position = self.position(job)
+                    if position != job.shown_position:
+                        job.shown_position = position
+                        try:
+                            await self.on_position(job, position)
+                        except Exception as e:
+                            logger.debug(f"Position update failed: {e}")
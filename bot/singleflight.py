@@ -0,0 +1,64 @@
+"""Coalesce concurrent work on the same key into one shared task."""
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+class _Flight:
+    __slots__ = ("task", "refs", "cleanup")
+
+    def __init__(self, task: asyncio.Task, cleanup):
+        self.task = task
+        self.refs = 0
+        self.cleanup = cleanup
+
+class SingleFlight:
+    """Registry of in-flight tasks keyed by e.g. (track_id, quality).
+
+    The first caller for a key starts the work; later callers await the same
+    task. Every caller holds a reference while it uses the result, and the
+    cleanup callback runs only after the last one has let go.
+    """
+
+    def __init__(self):
+        self._flights: dict[Hashable, _Flight] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._flights
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def keys(self) -> list:
+        return list(self._flights)
+
+    @asynccontextmanager
+    async def join(self, key: Hashable, factory: Callable[[], Awaitable[Any]],
+                   cleanup: Optional[Callable[[Any], Any]] = None):
+        """Yield the shared result for key, starting factory() if nobody else has."""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(factory()), cleanup)
+            self._flights[key] = flight
+        flight.refs += 1
+
+        try:
+            # Shielded so one waiter giving up doesn't cancel the others' work
+            yield await asyncio.shield(flight.task)
+        finally:
+            flight.refs -= 1
+            if flight.refs == 0:
+                del self._flights[key]
+                await self._finish(flight)
+
+    @staticmethod
+    async def _finish(flight: _Flight):
+        if not flight.task.done():
+            flight.task.cancel()
+            return
+        if flight.task.cancelled() or flight.task.exception() is not None:
+            return
+        if flight.cleanup is not None:
+            result = flight.cleanup(flight.task.result())
+            if asyncio.iscoroutine(result):
+                await result
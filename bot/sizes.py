@@ -0,0 +1,40 @@
+"""Persistent map from (track_id, quality) to the file size Tidal serves."""
+
+import time
+from typing import Optional
+
+from store import SQLiteStore
+
+class TrackSizes(SQLiteStore):
+    """Sizes learnt from probes and downloads, kept apart from the metadata cache."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS track_sizes (
+            track_id TEXT NOT NULL,
+            quality INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            updated REAL NOT NULL,
+            PRIMARY KEY (track_id, quality)
+        );
+    """
+
+    async def get(self, track_id: str, quality: int) -> Optional[int]:
+        return await self._run(self._select, track_id, quality)
+
+    async def set(self, track_id: str, quality: int, size: int):
+        await self._run(self._insert, track_id, quality, size)
+
+    def _select(self, track_id: str, quality: int) -> Optional[int]:
+        row = self._connect().execute(
+            "SELECT size FROM track_sizes WHERE track_id = ? AND quality = ?", (track_id, quality)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _insert(self, track_id: str, quality: int, size: int):
+        db = self._connect()
+        with db:
+            db.execute(
+                "INSERT OR REPLACE INTO track_sizes (track_id, quality, size, updated) "
+                "VALUES (?, ?, ?, ?)",
+                (track_id, quality, size, time.time()),
+            )
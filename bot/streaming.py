@@ -0,0 +1,89 @@
+"""Stream a CDN response straight into a Telegram upload."""
+
+import asyncio
+import hashlib
+import os
+from contextlib import suppress
+from typing import AsyncGenerator, Optional
+
+import aiohttp
+from aiogram.types import InputFile
+
+from common.downloadable import Downloadable
+from common.filesink import FileSink
+from common.integrity import IntegrityError, check_header, write_sidecar
+
+class StreamInputFile(InputFile):
+    """InputFile whose body is piped from the CDN while the upload runs.
+
+    A reader task fills a bounded queue, so at most buffer_size bytes sit
+    in memory between the two connections. With tee_path set, every chunk
+    is also written to disk and the file is renamed into place once the
+    whole body arrived, so the library still gets a copy. The copy is
+    hashed on the way to disk and gets a verified sidecar like a regular
+    download.
+    """
+
+    def __init__(self, downloadable: Downloadable, filename: str, size: int,
+                 buffer_size: int = 4 * 1024 * 1024, tee_path: Optional[str] = None):
+        super().__init__(filename=filename, chunk_size=downloadable.chunk_size)
+        self.downloadable = downloadable
+        self.size = size
+        self.buffer_size = buffer_size
+        self.tee_path = tee_path
+        self.teed = False  # True once tee_path holds the complete file
+
+    async def read(self, bot) -> AsyncGenerator[bytes, None]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, self.buffer_size // self.chunk_size))
+        reader = asyncio.create_task(self._fill(queue))
+        try:
+            while (chunk := await queue.get()) is not None:
+                yield chunk
+            await reader  # surface a short or failed transfer to the uploader
+        finally:
+            if not reader.done():
+                reader.cancel()
+                await asyncio.gather(reader, return_exceptions=True)
+
+    async def _fill(self, queue: asyncio.Queue):
+        sink = None
+        received = 0
+        head = b""
+        cancelled = False
+        try:
+            if self.tee_path:
+                sink = FileSink(self.tee_path + ".stream", 'wb',
+                                buffer_size=self.downloadable.buffer_size,
+                                hasher=hashlib.sha256())
+                await sink.open()
+            async for chunk in self.downloadable.iter_chunks():
+                if len(head) < 12:
+                    head += chunk[:12]
+                    if len(head) >= 12 and not check_header(head, self.downloadable.extension):
+                        raise IntegrityError(f"Bad {self.downloadable.extension} header from the CDN")
+                received += len(chunk)
+                if sink:
+                    await sink.write(chunk)
+                await queue.put(chunk)
+            if received != self.size:
+                raise aiohttp.ClientPayloadError(
+                    f"Stream ended after {received} of {self.size} bytes"
+                )
+            if sink:
+                await sink.close()
+                os.replace(sink.path, self.tee_path)
+                write_sidecar(self.tee_path, received, sink.hasher.hexdigest(), 1)
+                sink = None
+                self.teed = True
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            if sink:
+                await sink.close()
+                # open() may have failed before the file existed
+                with suppress(FileNotFoundError):
+                    os.remove(sink.path)
+            if not cancelled:
+                # The uploader is still draining, so this can't block for long
+                await queue.put(None)
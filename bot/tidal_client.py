@@ -1,10 +1,21 @@
 import aiohttp
 import base64
-import json
 import time
 import asyncio
 import os
-from typing import Optional
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Optional
+
+from common.downloadable import Downloadable
+from common.manifest import Manifest, ManifestCache, parse_manifest
+from common.metacache import MetadataCache
+from metrics import STAGE_SECONDS, TRANSFER_BYTES, TRANSFER_SECONDS
+from common.progress import Progress, ProgressUpdate
+from common.integrity import remove, verified
+from common.ratelimit import RateLimiter, parse_retry_after
+from common.session import SessionFactory
+from common.tagging import CoverCache, tag_file, tags_from_metadata
+from config import ACCOUNTS_FILE, TidalTokens
 
 BASE = "https://api.tidalhifi.com/v1"
 AUTH_URL = "https://auth.tidal.com/v1/oauth2"
@@ -21,36 +32,155 @@ QUALITY_MAP = {
     3: "HI_RES",  # MQA FLAC
 }
 
+MAX_THROTTLE_RETRIES = 5
+REFRESH_CHECK_INTERVAL = 300  # seconds between expiry checks in the background refresher
+REFRESH_RETRY_DELAY = 60  # seconds before retrying a failed background refresh
+EJECT_SECONDS = 300  # how long an account whose token can't be refreshed sits out
+TOKEN_RELOAD_INTERVAL = 5  # seconds between checks for tokens another process saved
+
 class TidalAuth:
-    """Handles Tidal authentication with token persistence."""
+    """One Tidal account: its tokens, rate budget, refresh schedule and health.
     
-    def __init__(self, config):
+    Each account gets its own rate limiter, so an AccountPool of several
+    accounts gets that many times the API budget. With refresh unset the
+    account never renews its tokens itself: another process does, and a
+    401 makes it reload what that process saved to ACCOUNTS_FILE.
+    """
+    
+    def __init__(self, config, sessions: Optional[SessionFactory] = None,
+                 tokens: Optional[TidalTokens] = None, save: Optional[Callable[[], None]] = None,
+                 refresh: bool = True, requests_per_minute: Optional[float] = None):
         self.config = config
-        self.session = None
-        self.tokens = config.load_tokens()
+        self.tokens = tokens if tokens is not None else config.load_tokens()
+        self.refresh = refresh
+        self.limiter = RateLimiter(requests_per_minute or config.REQUESTS_PER_MINUTE)
+        self.owns_sessions = sessions is None
+        self.sessions = sessions or SessionFactory(
+            verify_ssl=config.VERIFY_SSL,
+            api_connections=config.API_CONNECTIONS,
+            cdn_connections=config.CDN_CONNECTIONS,
+            cdn_connections_per_host=config.CDN_CONNECTIONS_PER_HOST,
+            keepalive_timeout=config.KEEPALIVE_TIMEOUT,
+            dns_cache_ttl=config.DNS_CACHE_TTL,
+        )
+        self.save = save or (lambda: config.save_tokens(self.tokens))
+        self.active = 0  # requests in flight
+        self.ejected_until = 0.0  # monotonic time the account may be used again
+        self.ejections = 0
+        self._refresh_lock = asyncio.Lock()
+        self._refresher: Optional[asyncio.Task] = None
         
-    async def _create_session(self):
-        if not self.session:
-            self.session = aiohttp.ClientSession()
+    @property
+    def name(self) -> str:
+        return self.tokens.user_id or "new"
+        
+    @property
+    def healthy(self) -> bool:
+        return bool(self.tokens.access_token) and time.monotonic() >= self.ejected_until
+        
+    def eject(self, seconds: float, reason: str):
+        """Take the account out of rotation for a while."""
+        if self.healthy:
+            # Requests already in flight fail too; only the first one counts
+            self.ejections += 1
+            print(f"Account {self.name} ejected for {seconds:.0f}s: {reason}")
+        self.ejected_until = max(self.ejected_until, time.monotonic() + seconds)
+        
+    def adopt(self, tokens: TidalTokens):
+        """Switch to tokens renewed elsewhere and put the account back in rotation."""
+        self.tokens = tokens
+        self.ejected_until = 0.0
+        
+    @asynccontextmanager
+    async def request(self, method: str, url: str, **kwargs):
+        """Send an API request through the rate limiter, waiting out 429s.
+        
+        A 401 renews the access token once and replays the request.
+        """
+        resp = await self.fetch(method, url, **kwargs)
+        try:
+            yield resp
+        finally:
+            resp.release()
+            
+    async def fetch(self, method: str, url: str, failover: bool = False, **kwargs) -> aiohttp.ClientResponse:
+        """request() without the context manager; the caller releases the response.
+        
+        With failover set, a 429 is returned right away instead of waited
+        out, so the caller can try another account.
+        """
+        authorized = not url.startswith(AUTH_URL) and bool(self.tokens.access_token)
+        resp = await self._send(method, url, authorized, failover, **kwargs)
+        if resp.status == 401 and authorized:
+            stale = resp.request_info.headers.get("authorization", "").removeprefix("Bearer ")
+            if await self.renew(stale):
+                resp.release()
+                resp = await self._send(method, url, authorized, failover, **kwargs)
+        return resp
+            
+    async def _send(self, method: str, url: str, authorized: bool, failover: bool = False,
+                    **kwargs) -> aiohttp.ClientResponse:
+        if authorized:
+            # Per request rather than on the session, which is shared with
+            # the OAuth endpoints that authenticate with client credentials
+            kwargs["headers"] = {
+                "authorization": f"Bearer {self.tokens.access_token}",
+                **kwargs.get("headers", {}),
+            }
+            
+        for attempt in range(MAX_THROTTLE_RETRIES + 1):
+            await self.limiter.acquire()
+            resp = await self.sessions.api.request(method, url, **kwargs)
+            if resp.status != 429:
+                self.limiter.success()
+                return resp
+            self.limiter.backoff(parse_retry_after(resp.headers.get("Retry-After")))
+            if failover or attempt == MAX_THROTTLE_RETRIES:
+                return resp
+            resp.release()
             
     async def is_token_valid(self) -> bool:
         """Check if access token is still valid."""
         if not self.tokens.access_token:
             return False
             
-        # Check if token expired (with 1 hour buffer)
-        if time.time() > (self.tokens.token_expiry - 3600):
+        # Check if token expired (or is about to)
+        if time.time() > (self.tokens.token_expiry - self.config.TOKEN_REFRESH_MARGIN):
             return False
             
         return True
         
-    async def refresh_token(self) -> bool:
-        """Refresh access token using refresh token."""
+    async def renew(self, stale_token: str) -> bool:
+        """Replace a rejected access token; False if there is no newer one."""
+        if self.refresh:
+            return await self.refresh_token(stale_token)
+        return self.reload(stale_token)
+        
+    def reload(self, stale_token: str) -> bool:
+        """Take this account's tokens from ACCOUNTS_FILE if they are newer than stale_token."""
+        if self.tokens.access_token != stale_token:
+            return True
+        for tokens in self.config.load_accounts():
+            if tokens.user_id == self.tokens.user_id and tokens.access_token != stale_token:
+                self.adopt(tokens)
+                return True
+        return False
+        
+    async def refresh_token(self, stale_token: Optional[str] = None) -> bool:
+        """Refresh access token using refresh token.
+        
+        Concurrent callers share one refresh. With stale_token set, the
+        refresh is skipped if another caller already replaced that token.
+        """
+        async with self._refresh_lock:
+            if stale_token is not None and self.tokens.access_token != stale_token:
+                return True
+            return await self._refresh_token()
+            
+    async def _refresh_token(self) -> bool:
         if not self.tokens.refresh_token:
             return False
             
-        await self._create_session()
-        
         data = {
             "client_id": CLIENT_ID,
             "refresh_token": self.tokens.refresh_token,
@@ -59,7 +189,7 @@ class TidalAuth:
         }
         
         try:
-            async with self.session.post(f"{AUTH_URL}/token", data=data, 
+            async with self.request("POST", f"{AUTH_URL}/token", data=data, 
                                        auth=aiohttp.BasicAuth(CLIENT_ID, CLIENT_SECRET)) as resp:
                 resp_data = await resp.json()
                 
@@ -69,13 +199,14 @@ class TidalAuth:
                 
             # Update tokens
             self.tokens.access_token = resp_data["access_token"]
-            self.tokens.refresh_token = resp_data["refresh_token"]
+            # Tidal only sometimes rotates the refresh token
+            self.tokens.refresh_token = resp_data.get("refresh_token", self.tokens.refresh_token)
             self.tokens.token_expiry = resp_data["expires_in"] + time.time()
             self.tokens.user_id = resp_data["user"]["userId"]
             self.tokens.country_code = resp_data["user"]["countryCode"]
             
             # Save updated tokens
-            self.config.save_tokens(self.tokens)
+            self.save()
             print("Token refreshed successfully")
             return True
             
@@ -85,12 +216,10 @@ class TidalAuth:
             
     async def device_login(self) -> bool:
         """Perform device login flow and save tokens."""
-        await self._create_session()
-        
         # Step 1: Get device code
         data = {"client_id": CLIENT_ID, "scope": "r_usr+w_usr+w_sub"}
         
-        async with self.session.post(f"{AUTH_URL}/device_authorization", data=data) as resp:
+        async with self.request("POST", f"{AUTH_URL}/device_authorization", data=data) as resp:
             resp_data = await resp.json()
             
         device_code = resp_data["deviceCode"]
@@ -113,7 +242,7 @@ class TidalAuth:
             await asyncio.sleep(4)
             
             try:
-                async with self.session.post(f"{AUTH_URL}/token", data=data, 
+                async with self.request("POST", f"{AUTH_URL}/token", data=data, 
                                            auth=aiohttp.BasicAuth(CLIENT_ID, CLIENT_SECRET)) as resp:
                     resp_data = await resp.json()
                     
@@ -125,7 +254,7 @@ class TidalAuth:
                     self.tokens.user_id = resp_data["user"]["userId"]
                     self.tokens.country_code = resp_data["user"]["countryCode"]
                     
-                    self.config.save_tokens(self.tokens)
+                    self.save()
                     print("✅ Authentication successful! Tokens saved.")
                     return True
                     
@@ -137,147 +266,402 @@ class TidalAuth:
         
     async def ensure_login(self) -> bool:
         """Ensure we have valid authentication."""
-        await self._create_session()
-        
         # Check if we have valid token
         if await self.is_token_valid():
-            # Set authorization header
-            self.session.headers.update({
-                "authorization": f"Bearer {self.tokens.access_token}"
-            })
+            self.start_refresher()
             return True
             
+        if not self.refresh:
+            # The refreshing process may have renewed it already; if not, a
+            # 401 or the pool's file watcher picks up its next save
+            self.reload(self.tokens.access_token)
+            return bool(self.tokens.access_token)
+            
         # Try to refresh token
         print("Token expired or invalid, trying to refresh...")
         if await self.refresh_token():
-            self.session.headers.update({
-                "authorization": f"Bearer {self.tokens.access_token}"
-            })
+            self.start_refresher()
             return True
             
         # If refresh failed, need new device login
         print("Refresh failed, need new device login...")
         return False
         
+    def start_refresher(self):
+        """Keep the access token fresh in the background until close()."""
+        if not self.refresh:
+            return
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.create_task(self._refresh_loop())
+            
+    async def _refresh_loop(self):
+        while True:
+            # Re-read the expiry every round; /login may have swapped the tokens
+            delay = self.tokens.token_expiry - self.config.TOKEN_REFRESH_MARGIN - time.time()
+            if delay > 0:
+                await asyncio.sleep(min(delay, REFRESH_CHECK_INTERVAL))
+                continue
+            stale = self.tokens.access_token
+            if not await self.refresh_token(stale):
+                await asyncio.sleep(REFRESH_RETRY_DELAY)
+                
     async def close(self):
-        if self.session:
-            await self.session.close()
+        if self._refresher is not None:
+            self._refresher.cancel()
+            await asyncio.gather(self._refresher, return_exceptions=True)
+            self._refresher = None
+        if self.owns_sessions:
+            await self.sessions.close()
+
+class AccountPool:
+    """Several Tidal accounts behind one request() that spreads the load.
+    
+    Each request goes to the healthy account with the fewest requests in
+    flight for its current rate budget, so throughput grows with the
+    number of accounts. An account that still answers 401 after a token
+    refresh, or answers 429, is ejected for EJECT_SECONDS or the
+    Retry-After. The request then moves on to the next account. If every
+    account is out, requests go to the one that comes back first.
+    
+    With refresh unset (worker processes), no account refreshes its own
+    tokens. The pool watches ACCOUNTS_FILE instead and adopts the logins
+    and refreshed tokens that the refreshing process saves there.
+    """
+    
+    def __init__(self, config, sessions: Optional[SessionFactory] = None,
+                 refresh: bool = True, requests_per_minute: Optional[float] = None):
+        self.config = config
+        self.refresh = refresh
+        self.requests_per_minute = requests_per_minute
+        self.session = None
+        self.owns_sessions = sessions is None
+        self.sessions = sessions or SessionFactory(
+            verify_ssl=config.VERIFY_SSL,
+            api_connections=config.API_CONNECTIONS,
+            cdn_connections=config.CDN_CONNECTIONS,
+            cdn_connections_per_host=config.CDN_CONNECTIONS_PER_HOST,
+            keepalive_timeout=config.KEEPALIVE_TIMEOUT,
+            dns_cache_ttl=config.DNS_CACHE_TTL,
+        )
+        self._mtime = _mtime(ACCOUNTS_FILE)
+        self._watcher: Optional[asyncio.Task] = None
+        self.accounts = [self.new_account(tokens) for tokens in config.load_accounts()]
+        
+    def new_account(self, tokens: Optional[TidalTokens] = None) -> TidalAuth:
+        """An account on the pool's connections that saves through the pool; add() puts it in rotation."""
+        return TidalAuth(self.config, self.sessions, tokens or TidalTokens(), save=self.save,
+                         refresh=self.refresh, requests_per_minute=self.requests_per_minute)
+        
+    async def add(self, account: TidalAuth):
+        """Put a logged-in account in rotation, replacing an older login of the same user."""
+        replaced = [a for a in self.accounts if a.tokens.user_id == account.tokens.user_id]
+        self.accounts = [a for a in self.accounts if a not in replaced]
+        self.accounts.append(account)
+        self.save()
+        # Their refreshers would keep renewing the superseded tokens
+        for old in replaced:
+            await old.close()
+        
+    def save(self):
+        self.config.save_accounts([a.tokens for a in self.accounts if a.tokens.refresh_token])
+        
+    @property
+    def tokens(self) -> TidalTokens:
+        """The first healthy account's tokens, for settings like the country code."""
+        for account in self.accounts:
+            if account.healthy:
+                return account.tokens
+        return self.accounts[0].tokens if self.accounts else TidalTokens()
+        
+    def pick(self, exclude: tuple = ()) -> Optional[TidalAuth]:
+        candidates = [a for a in self.accounts if a.tokens.access_token and a not in exclude]
+        healthy = [a for a in candidates if a.healthy]
+        if healthy:
+            return min(healthy, key=lambda a: (a.active + 1) / a.limiter.rate)
+        if candidates and not exclude:
+            return min(candidates, key=lambda a: a.ejected_until)
+        return None
+        
+    @asynccontextmanager
+    async def request(self, method: str, url: str, **kwargs):
+        """Send an API request on the least-loaded healthy account, failing over on 401/429."""
+        account = self.pick()
+        if account is None:
+            raise aiohttp.ClientError("No Tidal account is logged in")
+            
+        tried = []
+        while True:
+            tried.append(account)
+            params = kwargs.get("params")
+            if params and "countryCode" in params:
+                # Accounts may be registered in different countries
+                kwargs["params"] = {**params, "countryCode": account.tokens.country_code}
+            account.active += 1
+            try:
+                resp = await account.fetch(
+                    method, url, failover=self.pick(tuple(tried)) is not None, **kwargs
+                )
+            except BaseException:
+                account.active -= 1
+                raise
+                
+            if resp.status == 401:
+                account.eject(EJECT_SECONDS, "token rejected after refresh")
+            elif resp.status == 429:
+                account.eject(parse_retry_after(resp.headers.get("Retry-After")), "rate limited")
+            else:
+                break
+            following = self.pick(tuple(tried))
+            if following is None:
+                break
+            resp.release()
+            account.active -= 1
+            account = following
+            
+        try:
+            yield resp
+        finally:
+            resp.release()
+            account.active -= 1
+            
+    async def ensure_login(self) -> bool:
+        """Log in every account that has tokens; True if at least one made it."""
+        results = await asyncio.gather(*(a.ensure_login() for a in self.accounts))
+        for account, ok in zip(self.accounts, results):
+            if not ok:
+                print(f"Account {account.name} needs a new /login")
+        if not self.refresh and (self._watcher is None or self._watcher.done()):
+            self._watcher = asyncio.create_task(self._watch_loop())
+        if any(results):
+            self.session = self.sessions.api
+            return True
+        return False
+        
+    async def _watch_loop(self):
+        while True:
+            await asyncio.sleep(TOKEN_RELOAD_INTERVAL)
+            mtime = _mtime(ACCOUNTS_FILE)
+            if mtime != self._mtime:
+                self._mtime = mtime
+                await self.reload()
+                
+    async def reload(self):
+        """Adopt what another process saved: new logins, refreshed tokens, replaced accounts."""
+        loaded = {tokens.user_id: tokens for tokens in self.config.load_accounts()}
+        if not loaded:
+            return  # unreadable for a moment; keep what we have
+        for account in list(self.accounts):
+            tokens = loaded.pop(account.tokens.user_id, None)
+            if tokens is None:
+                self.accounts.remove(account)
+                await account.close()
+            elif tokens.access_token != account.tokens.access_token:
+                account.adopt(tokens)
+        self.accounts += [self.new_account(tokens) for tokens in loaded.values()]
+        if self.accounts:
+            self.session = self.sessions.api
+        
+    def stats(self) -> list[dict]:
+        now = time.monotonic()
+        return [
+            {
+                "account": account.name,
+                "healthy": account.healthy,
+                "active": account.active,
+                "ejected_for": max(0.0, account.ejected_until - now),
+                "ejections": account.ejections,
+                "throttled": account.limiter.throttled,
+            }
+            for account in self.accounts
+        ]
+        
+    async def close(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            await asyncio.gather(self._watcher, return_exceptions=True)
+            self._watcher = None
+        for account in self.accounts:
+            await account.close()
+        if self.owns_sessions:
+            await self.sessions.close()
+
+def _sent_country(resp: aiohttp.ClientResponse, default: str) -> str:
+    """The countryCode a response was fetched for; AccountPool sets it per account."""
+    return resp.request_info.url.query.get("countryCode", default)
+
+def _mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
 
 class TidalClient:
     """Main Tidal client for downloading tracks."""
     
-    def __init__(self, config):
+    def __init__(self, config, sessions: Optional[SessionFactory] = None,
+                 refresh: bool = True, requests_per_minute: Optional[float] = None):
         self.config = config
-        self.auth = TidalAuth(config)
-        self.session = None
+        self.auth = AccountPool(config, sessions, refresh, requests_per_minute)
+        self.sessions = self.auth.sessions
+        self.metadata = MetadataCache(
+            config.CACHE_DB,
+            max_entries=config.METADATA_CACHE_SIZE,
+            ttl=config.METADATA_TTL,
+        )
+        self.manifests = ManifestCache(config.MANIFEST_CACHE_SIZE, config.MANIFEST_TTL)
+        self.covers = CoverCache(self.sessions, config.COVER_CACHE_BYTES, config.COVER_SIZE)
+        
+    @property
+    def session(self):
+        """The API session once an account is logged in, also one a worker reloaded later."""
+        return self.auth.session
         
     async def login(self) -> bool:
         """Login to Tidal (automatic token management)."""
-        if await self.auth.ensure_login():
-            self.session = self.auth.session
-            return True
-        return False
+        return await self.auth.ensure_login()
+        
+    def request(self, method: str, url: str, **kwargs):
+        """Send a rate-limited API request with the authenticated session."""
+        return self.auth.request(method, url, **kwargs)
         
     async def get_track_info(self, track_id: str) -> Optional[dict]:
         """Get track information."""
         if not self.session:
             return None
             
+        country = self.auth.tokens.country_code
+        cached = await self.metadata.get(f"track:{track_id}:{country}")
+        if cached is not None:
+            return cached
+            
         params = {
-            "countryCode": self.auth.tokens.country_code,
+            "countryCode": country,
             "limit": 100
         }
         
         try:
-            async with self.session.get(f"{BASE}/tracks/{track_id}", params=params) as resp:
-                if resp.status == 404:
-                    return None
-                resp.raise_for_status()
-                return await resp.json()
+            with STAGE_SECONDS.time(stage="metadata"):
+                async with self.request("GET", f"{BASE}/tracks/{track_id}", params=params) as resp:
+                    if resp.status == 404:
+                        return None
+                    resp.raise_for_status()
+                    track_info = await resp.json()
+                    country = _sent_country(resp, country)
         except Exception as e:
             print(f"Error getting track info: {e}")
             return None
             
-    async def download_track(self, track_id: str, quality: Optional[int] = None) -> Optional[str]:
-        """Download track and return file path."""
-        if not self.session:
-            return None
+        await self.metadata.set(f"track:{track_id}:{country}", track_info)
+        return track_info
             
+    async def resolve_track(self, track_id: str, quality: Optional[int] = None,
+                            track_info: Optional[dict] = None) -> Optional[tuple[Downloadable, str]]:
+        """Resolve a track to a Downloadable and the path it should be saved to."""
         if quality is None:
             quality = self.config.QUALITY
             
         quality_str = QUALITY_MAP.get(quality, "LOSSLESS")
         
-        try:
-            # Get download URL
-            params = {
-                "audioquality": quality_str,
-                "playbackmode": "STREAM",
-                "assetpresentation": "FULL",
-                "countryCode": self.auth.tokens.country_code,
-            }
+        # Get download URL
+        manifest = await self._get_manifest(track_id, quality_str)
+        if not manifest:
+            return None
+        
+        # Get track info for filename
+        if track_info is None:
+            track_info = await self.get_track_info(track_id)
+        if not track_info:
+            print(f"Track {track_id} not found")
+            return None
             
-            async with self.session.get(
-                f"{BASE}/tracks/{track_id}/playbackinfopostpaywall", 
-                params=params
-            ) as resp:
-                resp_data = await resp.json()
-                
-            if "manifest" not in resp_data:
-                print(f"No manifest: {resp_data}")
-                return None
-                
-            # Decode manifest
-            manifest = json.loads(base64.b64decode(resp_data["manifest"]).decode("utf-8"))
-            download_url = manifest["urls"][0]
+        # Create safe filename
+        artist = track_info.get('artist', {}).get('name', 'Unknown Artist')
+        title = track_info.get('title', 'Unknown Track')
+        
+        # Clean filename (remove invalid characters)
+        def clean(text):
+            keep_chars = (' ', '-', '_', '.', ',', '&', "'", '(', ')')
+            return ''.join(c for c in text if c.isalnum() or c in keep_chars).strip()
             
-            # Get track info for filename
-            track_info = await self.get_track_info(track_id)
-            if not track_info:
-                print(f"Track {track_id} not found")
+        artist_clean = clean(artist)
+        title_clean = clean(title)
+        extension = manifest.extension
+        
+        # Truncate if too long. LOSSLESS and HI_RES are both .flac, so the
+        # quality goes into the name to keep them apart.
+        max_length = 100
+        suffix = f" [{quality_str}].{extension}"
+        filename = f"{artist_clean} - {title_clean}{suffix}"
+        if len(filename) > max_length:
+            filename = f"{artist_clean[:30]} - {title_clean[:50]}{suffix}"
+            
+        filepath = os.path.join(self.config.DOWNLOAD_FOLDER, filename)
+        
+        async def resolve() -> Manifest:
+            # The CDN rejected the signed URLs; skip the cache and fetch fresh ones
+            manifest = await self._get_manifest(track_id, quality_str, fresh=True)
+            if not manifest:
+                raise aiohttp.ClientError(f"No manifest for track {track_id}")
+            return manifest
+            
+        downloadable = Downloadable.from_manifest(
+            self.sessions.cdn,
+            manifest,
+            window=self.config.DASH_WINDOW,
+            chunk_size=self.config.CHUNK_SIZE,
+            buffer_size=self.config.WRITE_BUFFER_SIZE,
+            retries=self.config.DOWNLOAD_RETRIES,
+            resolve=resolve,
+        )
+        return downloadable, filepath
+        
+    async def download_track(self, track_id: str, quality: Optional[int] = None,
+                             track_info: Optional[dict] = None,
+                             resolved: Optional[tuple[Downloadable, str]] = None,
+                             on_progress: Optional[Callable[[ProgressUpdate], Any]] = None) -> Optional[str]:
+        """Download track and return file path.
+        
+        Pass track_info or an earlier resolve_track() result when the caller
+        already has them to skip those lookups. on_progress gets throttled
+        updates with speed and ETA every PROGRESS_INTERVAL seconds.
+        """
+        if not self.session:
+            return None
+            
+        try:
+            if resolved is None:
+                resolved = await self.resolve_track(track_id, quality, track_info)
+            if not resolved:
                 return None
-                
-            # Create safe filename
-            artist = track_info.get('artist', {}).get('name', 'Unknown Artist')
-            title = track_info.get('title', 'Unknown Track')
-            
-            # Clean filename (remove invalid characters)
-            def clean(text):
-                keep_chars = (' ', '-', '_', '.', ',', '&', "'", '(', ')')
-                return ''.join(c for c in text if c.isalnum() or c in keep_chars).strip()
-                
-            artist_clean = clean(artist)
-            title_clean = clean(title)
-            extension = "flac" if quality >= 2 else "m4a"
-            
-            # Truncate if too long
-            max_length = 100
-            filename = f"{artist_clean} - {title_clean}.{extension}"
-            if len(filename) > max_length:
-                filename = f"{artist_clean[:30]} - {title_clean[:50]}.{extension}"
-                
-            filepath = os.path.join(self.config.DOWNLOAD_FOLDER, filename)
+            downloadable, filepath = resolved
+            filename = os.path.basename(filepath)
             
-            # If file already exists, return it
-            if os.path.exists(filepath):
+            # Trust an existing file only if its sidecar says it arrived intact
+            if verified(filepath):
                 print(f"File already exists: {filename}")
                 return filepath
+            if os.path.exists(filepath):
+                print(f"Unverified file, downloading again: {filename}")
+                remove(filepath)
                 
-            # Download file
-            print(f"Downloading: {artist} - {title}")
-            async with self.session.get(download_url) as resp:
-                resp.raise_for_status()
-                
-                total_size = int(resp.headers.get('content-length', 0))
-                
-                with open(filepath, 'wb') as f:
-                    downloaded = 0
-                    async for chunk in resp.content.iter_chunked(8192):
-                        if chunk:
-                            f.write(chunk)
-                            downloaded += len(chunk)
-                            
-                print(f"Downloaded: {filename} ({downloaded} bytes)")
+            # Download file, resuming any .part left by an earlier attempt
+            print(f"Downloading: {filename}")
+            progress = Progress(on_progress or (lambda update: None),
+                                interval=self.config.PROGRESS_INTERVAL)
+            started = time.monotonic()
+            try:
+                with STAGE_SECONDS.time(stage="cdn"):
+                    await downloadable.download(filepath, progress)
+            finally:
+                await progress.close(final=False)
+                downloaded = progress.done - progress.resumed
+                TRANSFER_BYTES.inc(downloaded, direction="cdn")
+                TRANSFER_SECONDS.inc(time.monotonic() - started, direction="cdn")
+            print(f"Downloaded: {filename} ({downloaded} bytes)")
+            
+            if track_info is None:
+                track_info = await self.get_track_info(track_id)
+            await self.tag_track(filepath, track_info)
                 
             return filepath
             
@@ -285,8 +669,64 @@ class TidalClient:
             print(f"Error downloading track {track_id}: {e}")
             return None
             
+    async def tag_track(self, filepath: str, track_info: Optional[dict]) -> bool:
+        """Write tags and album art into a downloaded file; failures only get logged."""
+        if not self.config.TAG_FILES or not track_info:
+            return False
+        cover_id = track_info.get('album', {}).get('cover')
+        try:
+            with STAGE_SECONDS.time(stage="tagging"):
+                cover = await self.covers.get(cover_id) if cover_id else None
+                extension = os.path.splitext(filepath)[1].lstrip('.')
+                return await tag_file(filepath, extension, tags_from_metadata(track_info), cover)
+        except (OSError, ValueError) as e:
+            print(f"Could not tag {os.path.basename(filepath)}: {e}")
+            return False
+            
+    async def _get_manifest(self, track_id: str, quality_str: str,
+                            fresh: bool = False) -> Optional[Manifest]:
+        """Fetch and decode the playback manifest (BTS JSON or DASH MPD).
+        
+        Manifests are reused until shortly before their signed URLs expire,
+        unless fresh is set.
+        """
+        country = self.auth.tokens.country_code
+        if not fresh:
+            cached = self.manifests.get((track_id, quality_str, country))
+            if cached is not None:
+                return cached
+                
+        params = {
+            "audioquality": quality_str,
+            "playbackmode": "STREAM",
+            "assetpresentation": "FULL",
+            "countryCode": country,
+        }
+        
+        with STAGE_SECONDS.time(stage="playbackinfo"):
+            async with self.request(
+                "GET", f"{BASE}/tracks/{track_id}/playbackinfopostpaywall", 
+                params=params
+            ) as resp:
+                resp_data = await resp.json()
+                country = _sent_country(resp, country)
+            
+        if "manifest" not in resp_data:
+            print(f"No manifest: {resp_data}")
+            return None
+            
+        try:
+            manifest = parse_manifest(resp_data)
+        except (ValueError, KeyError) as e:
+            print(f"Bad manifest for track {track_id}: {e}")
+            return None
+            
+        self.manifests.set((track_id, quality_str, country), manifest)
+        return manifest
+            
     async def close(self):
         await self.auth.close()
+        await self.metadata.close()
         
     async def __aenter__(self):
         await self.login()
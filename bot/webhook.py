@@ -0,0 +1,95 @@
+"""Receive Telegram updates on an aiohttp server instead of long polling."""
+
+import asyncio
+import logging
+import secrets
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from metrics import WEBHOOK_UPDATES
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+MAX_TELEGRAM_CONNECTIONS = 100  # the most setWebhook accepts
+
+class WebhookServer:
+    """POST endpoint that hands updates to the dispatcher, max_concurrent at a time.
+
+    An update is acknowledged as soon as it has a processing slot, so a
+    slow handler never makes Telegram redeliver it. With every slot busy
+    the response waits for one, which pushes back on Telegram instead of
+    piling up tasks in memory.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, secret: str, max_concurrent: int = 40):
+        self.dp = dp
+        self.bot = bot
+        self.secret = secret
+        self.max_concurrent = max(1, max_concurrent)
+        self.slots = asyncio.Semaphore(self.max_concurrent)
+        self._tasks: set[asyncio.Task] = set()
+        self._runner = None
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        received = request.headers.get(SECRET_HEADER, "").encode()
+        if not secrets.compare_digest(received, self.secret.encode()):
+            WEBHOOK_UPDATES.inc(result="unauthorized")
+            return web.Response(status=401, text="Unauthorized")
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except ValueError:
+            WEBHOOK_UPDATES.inc(result="invalid")
+            return web.Response(status=400, text="Bad update")
+
+        await self.slots.acquire()
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        WEBHOOK_UPDATES.inc(result="accepted")
+        return web.Response()
+
+    async def _process(self, update: Update):
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception:
+            logger.exception(f"Update {update.update_id} failed")
+        finally:
+            self.slots.release()
+
+    async def start(self, host: str, port: int, path: str, url: str):
+        """Listen on host:port and point Telegram's webhook for this bot at url."""
+        app = web.Application()
+        app.router.add_post(path, self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+        await self.bot.set_webhook(
+            url,
+            secret_token=self.secret,
+            max_connections=min(self.max_concurrent, MAX_TELEGRAM_CONNECTIONS),
+            allowed_updates=self.dp.resolve_used_update_types(),
+        )
+        logger.info(f"Webhook listening on {host}:{port}{path}, delivered from {url}")
+
+    async def stop(self, timeout: float = 30):
+        """Stop accepting updates and give the ones in progress time to finish.
+
+        The webhook stays registered, so Telegram holds new updates until
+        we're back.
+        """
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        if self._tasks:
+            _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
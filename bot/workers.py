@@ -0,0 +1,60 @@
+"""Start and supervise the bot's worker processes."""
+
+import asyncio
+import logging
+import signal
+import sys
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+RESTART_DELAY = 5.0  # seconds before a crashed worker is started again
+STOP_TIMEOUT = 30.0  # seconds a worker gets to hand back its jobs before it's killed
+
+class WorkerProcesses:
+    """Keeps count copies of `python script worker <index>` running until stop()."""
+
+    def __init__(self, script: str, count: int):
+        self.script = script
+        self.count = count
+        self._processes: list[Optional[asyncio.subprocess.Process]] = [None] * count
+        self._tasks: list[asyncio.Task] = []
+        self._stopping = False
+
+    @property
+    def alive(self) -> int:
+        return sum(1 for p in self._processes if p is not None and p.returncode is None)
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._supervise(index)) for index in range(self.count)]
+
+    async def _supervise(self, index: int):
+        while not self._stopping:
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, self.script, "worker", str(index)
+            )
+            self._processes[index] = process
+            logger.info(f"Worker {index} started (pid {process.pid})")
+            code = await process.wait()
+            if self._stopping:
+                return
+            # Its leased jobs go back to the queue once the lease runs out
+            logger.warning(f"Worker {index} exited with {code}, restarting")
+            await asyncio.sleep(RESTART_DELAY)
+
+    async def stop(self):
+        self._stopping = True
+        for process in self._processes:
+            if process is not None and process.returncode is None:
+                process.send_signal(signal.SIGTERM)
+        for process in self._processes:
+            if process is None:
+                continue
+            try:
+                await asyncio.wait_for(process.wait(), STOP_TIMEOUT)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
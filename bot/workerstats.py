@@ -0,0 +1,48 @@
+"""Metric snapshots that worker processes leave for the front process's /stats."""
+
+import json
+import time
+
+from store import SQLiteStore
+
+class WorkerStats(SQLiteStore):
+    """One row per worker index holding its latest metrics.snapshot().
+
+    A restarted worker overwrites its predecessor's row, so its totals
+    start over like a restarted process's Prometheus counters would.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS worker_stats (
+            worker INTEGER PRIMARY KEY,
+            snapshot TEXT NOT NULL,
+            updated REAL NOT NULL
+        );
+    """
+
+    async def publish(self, worker: int, snapshot: dict):
+        await self._run(self._publish, worker, json.dumps(snapshot))
+
+    async def collect(self) -> list[dict]:
+        return await self._run(self._collect)
+
+    async def clear(self):
+        """Forget the snapshots of an earlier run."""
+        await self._run(self._clear)
+
+    def _publish(self, worker: int, snapshot: str):
+        db = self._connect()
+        with db:
+            db.execute(
+                "INSERT OR REPLACE INTO worker_stats (worker, snapshot, updated) VALUES (?, ?, ?)",
+                (worker, snapshot, time.time()),
+            )
+
+    def _collect(self) -> list[dict]:
+        rows = self._connect().execute("SELECT snapshot FROM worker_stats").fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def _clear(self):
+        db = self._connect()
+        with db:
+            db.execute("DELETE FROM worker_stats")
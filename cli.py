@@ -1,78 +1,232 @@
-"""Minimal CLI for downloading Tidal tracks by ID."""
+"""Minimal CLI for downloading Tidal tracks by ID.
 
-import asyncio
-import click
+Jobs go to a running daemon (see daemon.py) when there is one. Only
+the stdlib and click are imported before that check; asyncio, aiohttp
+and the download code are imported when the job runs in this process.
+"""
+
+import json
 import os
-from pathlib import Path
+import socket
+import sys
+import time
+from dataclasses import replace
+from typing import Optional
+
+import click
+
 from config import Config
-from tidal import TidalClient
+
+def submit(path: str, job: dict) -> Optional[int]:
+    """Run job on the daemon at path and echo its output; None if no daemon is listening."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        return None
+
+    with sock, sock.makefile('rwb') as stream:
+        stream.write(json.dumps(job).encode() + b"\n")
+        stream.flush()
+        try:
+            for line in stream:
+                message = json.loads(line)
+                if "exit" in message:
+                    return message["exit"]
+                sys.stdout.write(message["out"] + message["end"])
+                sys.stdout.flush()
+        except KeyboardInterrupt:
+            # Closing the socket tells the daemon to cancel the job
+            return 130
+    print("Daemon closed the connection")
+    return 1
 
 @click.command()
-@click.argument('track_id')
+@click.argument('track_ids', nargs=-1)
 @click.option('--quality', '-q', type=int, default=2, help='Quality: 0=LOW, 1=HIGH, 2=LOSSLESS, 3=HI_RES')
 @click.option('--output', '-o', type=click.Path(), help='Output directory')
-def download_track(track_id, quality, output):
-    """Download a Tidal track by ID."""
-    asyncio.run(main(track_id, quality, output))
+@click.option('--segments', '-s', type=int, default=1, help='Parallel connections per file (1 = single stream)')
+@click.option('--file', '-f', 'id_file', type=click.File('r'), help='Read track IDs from a file, one per line ("-" for stdin)')
+@click.option('--album', '-a', multiple=True, help='Album ID to expand into its tracks (repeatable)')
+@click.option('--playlist', '-p', multiple=True, help='Playlist UUID to expand into its tracks (repeatable)')
+@click.option('--concurrency', '-j', type=int, default=4, help='Tracks downloaded at the same time')
+@click.option('--no-daemon', is_flag=True, help='Run in this process even if a daemon is listening')
+def download_track(track_ids, quality, output, segments, id_file, album, playlist, concurrency, no_daemon):
+    """Download Tidal tracks by ID."""
+    track_ids = list(track_ids)
+    if id_file:
+        track_ids += [line.strip() for line in id_file if line.strip() and not line.startswith('#')]
+
+    if quality not in range(4):
+        print(f"Invalid quality: {quality}. Must be 0-3")
+        raise SystemExit(2)
+
+    if not no_daemon:
+        # A running daemon already has a logged-in client; hand it the job
+        job = {
+            "track_ids": track_ids,
+            "quality": quality,
+            "output": os.path.abspath(output) if output else None,
+            "segments": segments,
+            "albums": list(album),
+            "playlists": list(playlist),
+            "concurrency": concurrency,
+        }
+        status = submit(Config().daemon.socket, job)
+        if status is not None:
+            raise SystemExit(status)
+
+    import asyncio
+    ok = asyncio.run(main(track_ids, quality, output, segments, album, playlist, concurrency))
+    # Same exit status as a job run by the daemon
+    raise SystemExit(0 if ok else 1)
+
+async def main(track_ids, quality, output_dir, segments=1, albums=(), playlists=(), concurrency=4) -> bool:
+    """Log in and run one job in this process; True if every track arrived."""
+    from tidal import TidalClient
 
-async def main(track_id, quality, output_dir):
     config = Config()
-    
+
     if quality not in range(4):
         print(f"Invalid quality: {quality}. Must be 0-3")
-        return
-    
-    config.tidal.quality = quality
-    
-    if output_dir:
-        config.downloads.folder = output_dir
-    
-    # Ensure output directory exists
-    os.makedirs(config.downloads.folder, exist_ok=True)
-    
+        return False
+
+    if isinstance(track_ids, str):
+        track_ids = [track_ids]
+
     client = TidalClient(config)
-    
+
     try:
         print("Logging in to Tidal...")
         await client.login()
-        
-        print(f"Fetching track info for ID: {track_id}...")
-        metadata = await client.get_metadata(track_id, "track")
-        
-        track_title = metadata.get('title', 'Unknown Track')
-        artist = metadata.get('artist', {}).get('name', 'Unknown Artist')
-        
-        print(f"Track: {artist} - {track_title}")
-        
-        print("Getting download URL...")
-        downloadable = await client.get_downloadable(track_id, quality)
-        
-        # Create filename
-        safe_title = "".join(c for c in track_title if c.isalnum() or c in (' ', '-', '_')).rstrip()
-        safe_artist = "".join(c for c in artist if c.isalnum() or c in (' ', '-', '_')).rstrip()
-        filename = f"{safe_artist} - {safe_title}.{downloadable.extension}"
-        filepath = os.path.join(config.downloads.folder, filename)
-        
-        print(f"Downloading to: {filepath}")
-        
-        # Simple progress callback
-        total_size = await downloadable.size()
-        downloaded = 0
-        
-        def progress_callback(chunk_size):
-            nonlocal downloaded
-            downloaded += chunk_size
-            percent = (downloaded / total_size) * 100 if total_size > 0 else 0
-            print(f"\rProgress: {downloaded}/{total_size} bytes ({percent:.1f}%)", end='')
-        
-        await downloadable.download(filepath, progress_callback)
-        print(f"\nDownload complete: {filepath}")
-        
+        return await run_job(client, config, track_ids, quality, output_dir, segments,
+                             albums, playlists, concurrency)
     except Exception as e:
         print(f"Error: {e}")
+        return False
+    finally:
+        await client.close()
+
+async def run_job(client, config, track_ids, quality, output_dir=None, segments=1, albums=(),
+                  playlists=(), concurrency=4, echo=print) -> bool:
+    """Expand albums and playlists, download everything and print a summary.
+
+    Settings that differ per invocation live in a copy of the downloads
+    config, so the daemon can run jobs side by side on one client. Returns
+    True if every track arrived.
+    """
+    downloads = replace(
+        config.downloads,
+        folder=output_dir or config.downloads.folder,
+        segments=max(1, segments),
+    )
+
+    # Ensure output directory exists
+    os.makedirs(downloads.folder, exist_ok=True)
+
+    track_ids = list(track_ids)
+    for album_id in albums:
+        echo(f"Expanding album {album_id}...")
+        track_ids += await client.get_album_tracks(album_id)
+    for playlist_id in playlists:
+        echo(f"Expanding playlist {playlist_id}...")
+        track_ids += await client.get_playlist_tracks(playlist_id)
+
+    # Drop duplicates but keep the requested order
+    track_ids = list(dict.fromkeys(track_ids))
+    if not track_ids:
+        echo("No track IDs given")
+        return False
+
+    return await download_batch(client, downloads, track_ids, quality, concurrency, echo)
+
+async def download_batch(client, downloads, track_ids, quality, concurrency, echo=print) -> bool:
+    """Download tracks through a bounded worker pool and print a summary."""
+    import asyncio
+
+    queue = asyncio.Queue()
+    for track_id in track_ids:
+        queue.put_nowait(track_id)
+
+    verbose = len(track_ids) == 1
+    sizes = {}
+    failures = {}
+    started = time.monotonic()
+
+    async def worker():
+        while not queue.empty():
+            track_id = queue.get_nowait()
+            try:
+                sizes[track_id] = await download_one(client, downloads, track_id, quality, verbose, echo)
+            except Exception as e:
+                failures[track_id] = e
+                echo(f"Failed {track_id}: {e}")
+
+    workers = min(max(1, concurrency), len(track_ids))
+    await asyncio.gather(*(worker() for _ in range(workers)))
+
+    elapsed = time.monotonic() - started
+    total_bytes = sum(sizes.values())
+    rate = total_bytes / elapsed / (1024 * 1024) if elapsed > 0 else 0
+    echo(
+        f"\nDone: {len(sizes)}/{len(track_ids)} tracks, "
+        f"{total_bytes / (1024 * 1024):.1f} MB in {elapsed:.1f}s ({rate:.2f} MB/s)"
+    )
+    if failures:
+        echo(f"Failed ({len(failures)}): {', '.join(failures)}")
+    return not failures
+
+async def download_one(client, downloads, track_id, quality, verbose=True, echo=print) -> int:
+    """Download a single track and return the number of bytes fetched."""
+    from common.integrity import verified
+    from common.progress import Progress, print_progress
+
+    if verbose:
+        echo(f"Fetching track info for ID: {track_id}...")
+    metadata = await client.get_metadata(track_id, "track")
+
+    track_title = metadata.get('title', 'Unknown Track')
+    artist = metadata.get('artist', {}).get('name', 'Unknown Artist')
+
+    if verbose:
+        echo(f"Track: {artist} - {track_title}")
+        echo("Getting download URL...")
+    downloadable = await client.get_downloadable(track_id, quality, downloads.segments)
+
+    # Create filename
+    safe_title = "".join(c for c in track_title if c.isalnum() or c in (' ', '-', '_')).rstrip()
+    safe_artist = "".join(c for c in artist if c.isalnum() or c in (' ', '-', '_')).rstrip()
+    filename = f"{safe_artist} - {safe_title}.{downloadable.extension}"
+    filepath = os.path.join(downloads.folder, filename)
+
+    if verified(filepath):
+        echo(f"Already downloaded: {filepath}")
+        return 0
+
+    echo(f"Downloading to: {filepath}")
+
+    # Progress is only drawn for a single track; a batch prints a summary instead
+    if not verbose:
+        render = lambda update: None
+    elif echo is print:
+        render = print_progress
+    else:
+        render = lambda update: echo(f"\rProgress: {update.describe()}\033[K", end="")
+    progress = Progress(render, interval=downloads.progress_interval)
+    try:
+        await downloadable.download(filepath, progress)
     finally:
-        if client.session:
-            await client.session.close()
+        await progress.close(final=verbose)
+        if verbose:
+            echo()
+    if downloads.tag_files:
+        try:
+            await client.tag(filepath, downloadable.extension, metadata)
+        except (OSError, ValueError) as e:
+            echo(f"Could not tag {filepath}: {e}")
+    echo(f"Download complete: {filepath}")
+    return progress.done - progress.resumed
 
 if __name__ == "__main__":
-    download_track()
\ No newline at end of file
+    download_track()
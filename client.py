@@ -3,7 +3,7 @@
 import aiohttp
 from abc import ABC, abstractmethod
 
-from downloadable import Downloadable
+from common.downloadable import Downloadable
 
 class Client(ABC):
     source: str
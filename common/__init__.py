@@ -0,0 +1 @@
+"""Download, caching and tagging code shared by cli.py and the Telegram bot."""
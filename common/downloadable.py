@@ -0,0 +1,392 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+import aiohttp
+from collections import deque
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Any, Optional
+
+from .filesink import FileSink, DEFAULT_BUFFER_SIZE
+from .integrity import IntegrityError, check_header, combine_digests, read_header, write_sidecar
+from .manifest import Manifest
+from .progress import Progress
+
+MIN_SEGMENT_SIZE = 1024 * 1024
+CHECKPOINT_INTERVAL = 1.0  # seconds between sidecar writes
+EXPIRED_STATUSES = (403, 404, 410)  # signed CDN URL no longer valid
+
+class RangeNotSupported(Exception):
+    """Server ignored a Range request or the resource changed under us."""
+
+class Checkpoint:
+    """Sidecar next to a .part file recording how far each byte range got.
+
+    Segments are [start, position, end] where position is the next byte to
+    write and end is inclusive, or None while the total size is unknown.
+    Digests maps a finished segment's start to the SHA-256 of its bytes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.size = 0
+        self.segments: list[list] = []
+        self.digests: dict[str, str] = {}
+        self._saved_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def load(self) -> bool:
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.size = data["size"]
+            self.segments = data["segments"]
+            self.digests = data.get("digests", {})
+            return True
+        except (OSError, ValueError, KeyError):
+            return False
+
+    @property
+    def done(self) -> int:
+        return sum(position - start for start, position, _ in self.segments)
+
+    @property
+    def complete(self) -> bool:
+        return all(end is not None and position > end for _, position, end in self.segments)
+
+    async def save(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._saved_at < CHECKPOINT_INTERVAL:
+            return
+        self._saved_at = now
+        data = json.dumps({"size": self.size, "segments": self.segments, "digests": self.digests})
+        async with self._lock:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, data)
+
+    def _write(self, data: str):
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w') as f:
+            f.write(data)
+        os.replace(tmp, self.path)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+@dataclass(slots=True)
+class Downloadable:
+    session: aiohttp.ClientSession
+    url: str
+    extension: str
+    source: str = "tidal"
+    segments: int = 1  # >1 enables concurrent Range requests
+    chunk_size: int = 64 * 1024
+    buffer_size: int = DEFAULT_BUFFER_SIZE
+    retries: int = 3
+    resolve: Optional[Callable[[], Awaitable[Manifest]]] = None  # fetches fresh signed URLs
+
+    @classmethod
+    def from_manifest(cls, session: aiohttp.ClientSession, manifest: Manifest, **kwargs) -> "Downloadable":
+        """Build a plain or segmented DASH Downloadable for a parsed manifest."""
+        if manifest.segmented:
+            return DashDownloadable(
+                session,
+                url=manifest.init_url or manifest.segment_urls[0],
+                extension=manifest.extension,
+                init_url=manifest.init_url,
+                segment_urls=manifest.segment_urls,
+                **kwargs,
+            )
+        kwargs.pop("window", None)
+        return cls(session, url=manifest.urls[0], extension=manifest.extension, **kwargs)
+
+    def _apply(self, manifest: Manifest):
+        self.url = manifest.urls[0]
+
+    async def download(self, path: str, callback: Callable[[int], Any]) -> dict:
+        """Download into path.part, resuming from its checkpoint, then rename into place.
+
+        callback gets each byte count; a Progress also learns the total size.
+        Bytes are hashed as they are written. The finished file is checked
+        against the expected size and its container header, and the result
+        is recorded in a sidecar (see integrity.verified); that record is
+        returned.
+        """
+        part = path + ".part"
+        checkpoint = Checkpoint(part + ".json")
+        if checkpoint.load() and os.path.exists(part) and checkpoint.done:
+            # Bytes left by an earlier run
+            if isinstance(callback, Progress):
+                callback.resume(checkpoint.done)
+            else:
+                callback(checkpoint.done)
+
+        attempt = 0
+        while True:
+            done = checkpoint.done
+            try:
+                await self._download(part, checkpoint, callback)
+                break
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if checkpoint.done > done:
+                    attempt = 0  # retries count consecutive failures, not a whole long transfer
+                if attempt == self.retries:
+                    raise
+                expired = isinstance(e, aiohttp.ClientResponseError) and e.status in EXPIRED_STATUSES
+                if expired and self.resolve is not None:
+                    self._apply(await self.resolve())
+                else:
+                    await asyncio.sleep(2 ** attempt)
+                attempt += 1
+
+        record = await asyncio.get_running_loop().run_in_executor(
+            None, self._finish, part, path, checkpoint
+        )
+        checkpoint.remove()
+        return record
+
+    def _finish(self, part: str, path: str, checkpoint: Checkpoint) -> dict:
+        size = os.path.getsize(part)
+        expected = checkpoint.size or checkpoint.done
+        if size != expected or not check_header(read_header(part), self.extension):
+            # Resuming would only reproduce the same bytes; start from scratch next time
+            os.remove(part)
+            checkpoint.remove()
+            raise IntegrityError(
+                f"{os.path.basename(path)}: got {size} of {expected} bytes or a bad {self.extension} header"
+            )
+
+        digests = []
+        for start, position, _ in sorted(checkpoint.segments):
+            digest = checkpoint.digests.get(str(start))
+            if digest is None:
+                # Finished by a version that didn't hash inline; only this range is read back
+                hasher = hashlib.sha256()
+                self._hash_file(part, start, position, hasher)
+                digest = hasher.hexdigest()
+            digests.append(digest)
+
+        os.replace(part, path)
+        return write_sidecar(path, size, combine_digests(digests), len(digests))
+
+    @staticmethod
+    def _hash_file(path: str, start: int, end: int, hasher):
+        with open(path, 'rb') as f:
+            f.seek(start)
+            while start < end:
+                block = f.read(min(MIN_SEGMENT_SIZE, end - start))
+                if not block:
+                    break
+                hasher.update(block)
+                start += len(block)
+
+    async def _download(self, part: str, checkpoint: Checkpoint, callback):
+        if not (checkpoint.load() and os.path.exists(part)):
+            await self._plan(part, checkpoint, self.segments)
+        if isinstance(callback, Progress) and not callback.total:
+            callback.total = checkpoint.size
+
+        try:
+            await self._download_segments(part, checkpoint, callback)
+        except RangeNotSupported:
+            # Start over as one plain stream
+            await self._plan(part, checkpoint, 1)
+            await self._download_segments(part, checkpoint, callback)
+
+        if not checkpoint.complete:
+            raise aiohttp.ClientPayloadError("Download ended before all bytes arrived")
+
+    async def _plan(self, part: str, checkpoint: Checkpoint, segments: int):
+        size, ranges = await self._probe()
+        count = 1
+        if segments > 1 and ranges and size >= 2 * MIN_SEGMENT_SIZE:
+            count = min(segments, size // MIN_SEGMENT_SIZE)
+
+        checkpoint.size = size
+        checkpoint.digests = {}
+        if size:
+            step = -(-size // count)
+            checkpoint.segments = [
+                [start, start, min(start + step, size) - 1] for start in range(0, size, step)
+            ]
+        else:
+            checkpoint.segments = [[0, 0, None]]
+
+        # Preallocate so every segment can write at its own offset
+        async with FileSink(part, 'wb') as sink:
+            await sink.truncate(size)
+        await checkpoint.save(force=True)
+
+    async def _download_segments(self, part: str, checkpoint: Checkpoint, callback):
+        tasks = [
+            asyncio.create_task(self._download_range(part, segment, checkpoint, callback))
+            for segment in checkpoint.segments
+            if segment[2] is None or segment[1] <= segment[2]
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            await checkpoint.save(force=True)
+
+    async def _download_range(self, part: str, segment: list, checkpoint: Checkpoint, callback):
+        start, position, end = segment
+        headers = {}
+        partial = position > 0 or (end is not None and end < checkpoint.size - 1)
+        if partial:
+            headers["Range"] = f"bytes={position}-{'' if end is None else end}"
+
+        hasher = hashlib.sha256()
+        if position > start:
+            # Resuming mid-segment: the earlier bytes of this range only exist on disk
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._hash_file, part, start, position, hasher
+            )
+
+        async with self.session.get(self.url, headers=headers) as resp:
+            resp.raise_for_status()
+            if partial and (resp.status != 206 or not self._same_resource(resp, checkpoint)):
+                raise RangeNotSupported(self.url)
+
+            sink = FileSink(part, 'r+b', position, self.buffer_size, hasher)
+            try:
+                async with sink:
+                    async for chunk in resp.content.iter_chunked(self.chunk_size):
+                        await sink.write(chunk)
+                        callback(len(chunk))
+                        segment[1] = sink.position
+                        await checkpoint.save()
+            finally:
+                segment[1] = sink.position
+
+            received = sink.position - position
+            if resp.content_length is not None and received != resp.content_length:
+                raise aiohttp.ClientPayloadError(
+                    f"Got {received} of {resp.content_length} bytes announced by Content-Length"
+                )
+
+        if end is None:
+            segment[2] = segment[1] - 1
+        checkpoint.digests[str(start)] = hasher.hexdigest()
+
+    async def iter_chunks(self):
+        """Yield the body as it arrives, for consumers that don't want a file."""
+        async with self.session.get(self.url) as resp:
+            resp.raise_for_status()
+            async for chunk in resp.content.iter_chunked(self.chunk_size):
+                yield chunk
+
+    @staticmethod
+    def _same_resource(resp: aiohttp.ClientResponse, checkpoint: Checkpoint) -> bool:
+        """Make sure a resumed range belongs to a body of the size we started with."""
+        total = resp.headers.get("Content-Range", "").rpartition("/")[2]
+        return not checkpoint.size or total in ("", "*") or total == str(checkpoint.size)
+
+    async def _probe(self) -> tuple[int, bool]:
+        """Return the content length and whether byte ranges are accepted.
+
+        A failed HEAD yields (0, False): its headers describe an error body,
+        so the download falls back to one plain GET that reports the failure.
+        """
+        async with self.session.head(self.url) as response:
+            if not 200 <= response.status < 300:
+                return 0, False
+            content_length = int(response.headers.get("Content-Length", 0))
+            accept_ranges = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+            return content_length, accept_ranges
+
+    async def size(self) -> int:
+        size, _ = await self._probe()
+        return size
+
+@dataclass(slots=True)
+class DashDownloadable(Downloadable):
+    """DASH stream: an init segment plus media segments, stitched in order.
+
+    Up to window segments are fetched at once while the writer appends
+    them in order. The checkpoint records one finished range per segment,
+    so a resume restarts at the first segment that didn't reach the disk.
+    """
+    init_url: Optional[str] = None
+    segment_urls: list[str] = field(default_factory=list)
+    window: int = 4  # segments in flight ahead of the writer
+
+    @property
+    def pieces(self) -> list[str]:
+        return ([self.init_url] if self.init_url else []) + self.segment_urls
+
+    def _apply(self, manifest: Manifest):
+        self.init_url = manifest.init_url
+        self.segment_urls = manifest.segment_urls
+        self.url = self.pieces[0]
+
+    async def _download(self, part: str, checkpoint: Checkpoint, callback):
+        if not (checkpoint.load() and os.path.exists(part)):
+            checkpoint.size = 0
+            checkpoint.segments = []
+            checkpoint.digests = {}
+
+        offset = checkpoint.done
+        written: list[list] = []  # handed to the sink but maybe not on disk yet
+        sink = FileSink(part, 'r+b' if offset else 'wb', offset, self.buffer_size)
+        try:
+            async with sink:
+                # Drop whatever an interrupted segment left behind the last finished one
+                await sink.truncate(offset)
+                async with aclosing(self._iter_pieces(len(checkpoint.segments))) as pieces:
+                    async for data in pieces:
+                        await sink.write(data)
+                        callback(len(data))
+                        written.append([offset, offset + len(data), offset + len(data) - 1])
+                        checkpoint.digests[str(offset)] = hashlib.sha256(data).hexdigest()
+                        offset += len(data)
+                        self._settle(written, checkpoint, sink.position)
+                        await checkpoint.save()
+        finally:
+            self._settle(written, checkpoint, sink.position)
+            await checkpoint.save(force=True)
+
+        if len(checkpoint.segments) != len(self.pieces):
+            raise aiohttp.ClientPayloadError("Download ended before all segments arrived")
+
+    @staticmethod
+    def _settle(written: list[list], checkpoint: Checkpoint, position: int):
+        """Move segments that are fully on disk into the checkpoint."""
+        while written and written[0][1] <= position:
+            checkpoint.segments.append(written.pop(0))
+
+    async def _iter_pieces(self, start: int = 0):
+        urls = iter(self.pieces[start:])
+        pending: deque[asyncio.Task] = deque()
+        try:
+            while True:
+                while len(pending) < self.window and (url := next(urls, None)) is not None:
+                    pending.append(asyncio.create_task(self._fetch(url)))
+                if not pending:
+                    return
+                yield await pending.popleft()
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _fetch(self, url: str) -> bytes:
+        async with self.session.get(url) as resp:
+            resp.raise_for_status()
+            return await resp.read()
+
+    def iter_chunks(self):
+        """Yield the stitched stream one segment at a time."""
+        return self._iter_pieces()
+
+    async def size(self) -> int:
+        # Segment sizes aren't known without fetching them; callers treat 0 as unknown
+        return 0
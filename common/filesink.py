@@ -0,0 +1,116 @@
+"""Buffered file writer that keeps disk I/O off the event loop."""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+# Dedicated pool so disk writes never queue behind DNS lookups in the default executor
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="filesink")
+
+class FileSink:
+    """Accumulates chunks and writes them in large blocks from a thread pool.
+
+    One block may be in flight while the next one fills, so network reads
+    and disk writes overlap instead of taking turns.
+    """
+
+    def __init__(self, path: str, mode: str = 'wb', offset: int = 0,
+                 buffer_size: int = DEFAULT_BUFFER_SIZE, hasher=None):
+        self.path = path
+        self.mode = mode
+        self.offset = offset
+        self.buffer_size = buffer_size
+        self.hasher = hasher  # hashlib object fed every block in file order
+        self.position = offset  # file offset up to which bytes have been written
+        self._buffer = bytearray()
+        self._file = None
+        self._pending: Optional[asyncio.Future] = None
+
+    async def open(self):
+        self._file = await self._run(self._open)
+
+    def _open(self):
+        f = open(self.path, self.mode)
+        if self.offset:
+            f.seek(self.offset)
+        return f
+
+    async def write(self, chunk: bytes):
+        self._buffer += chunk
+        if len(self._buffer) >= self.buffer_size:
+            await self.flush(wait=False)
+
+    async def flush(self, wait: bool = True):
+        """Hand the buffer to the pool; with wait=False only the previous block is awaited."""
+        await self._drain()
+        if self._buffer:
+            data = bytes(self._buffer)
+            self._buffer.clear()
+            self._pending = asyncio.get_running_loop().run_in_executor(
+                _executor, self._write_block, data
+            )
+        if wait:
+            await self._drain()
+
+    def _write_block(self, data: bytes) -> int:
+        # Blocks are handed over one at a time, so hashing here keeps file order
+        if self.hasher is not None:
+            self.hasher.update(data)
+        return self._file.write(data)
+
+    async def _drain(self):
+        pending = self._pending
+        if pending is None:
+            return
+        # Shielded so a cancelled caller leaves the block pending: the write
+        # finishes in its thread, nothing new is submitted on top of it, and
+        # close() still counts it in position
+        try:
+            written = await asyncio.shield(pending)
+        except Exception:
+            self._pending = None
+            raise
+        self._pending = None
+        self.position += written
+
+    async def truncate(self, size: int):
+        await self.flush()
+        await self._run(self._file.truncate, size)
+
+    async def close(self):
+        if self._file is None:
+            return
+        try:
+            await self.flush()
+        finally:
+            # Even when cancelled again, the file is closed only after the last write
+            await asyncio.shield(self._close())
+
+    async def _close(self):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            try:
+                self.position += await pending
+            except Exception:
+                pass  # close() is already raising whatever interrupted the flush
+        await self._run(self._file.close)
+        self._file = None
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            await self.close()
+            return
+        # Bytes already received are still valid; keep them but never mask the original error
+        try:
+            await self.close()
+        except Exception:
+            pass
@@ -0,0 +1,85 @@
+"""Header sanity checks and verified-file sidecars."""
+
+import hashlib
+import json
+import os
+import time
+from typing import Optional
+
+SIDECAR_SUFFIX = ".verified.json"
+HEADER_SIZE = 12
+
+class IntegrityError(Exception):
+    """A finished download failed its size or header check."""
+
+def check_header(head: bytes, extension: str) -> bool:
+    """Cheap sanity check that the first bytes look like the expected container."""
+    if extension == "flac":
+        return head[:4] == b"fLaC"
+    if extension in ("m4a", "mp4"):
+        # DASH streams without an init segment start at a fragment
+        return head[4:8] in (b"ftyp", b"styp", b"moof")
+    return True
+
+def read_header(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read(HEADER_SIZE)
+
+def combine_digests(digests: list[str]) -> str:
+    """One SHA-256 for a file hashed in parts: the part digest itself, or a hash over all of them."""
+    if len(digests) == 1:
+        return digests[0]
+    tree = hashlib.sha256()
+    for digest in digests:
+        tree.update(bytes.fromhex(digest))
+    return tree.hexdigest()
+
+def write_sidecar(path: str, size: int, digest: str, parts: int) -> dict:
+    """Record that path was received intact, pinned to its current size and mtime."""
+    stat = os.stat(path)
+    record = {
+        "size": size,
+        "sha256": digest,
+        "parts": parts,  # 1 = SHA-256 of the file, otherwise over the part digests
+        "mtime_ns": stat.st_mtime_ns,
+        "verified_at": time.time(),
+    }
+    tmp = path + SIDECAR_SUFFIX + ".tmp"
+    with open(tmp, 'w') as f:
+        json.dump(record, f)
+    os.replace(tmp, path + SIDECAR_SUFFIX)
+    return record
+
+def verified(path: str) -> Optional[dict]:
+    """The sidecar record if path still matches it, without reading the file itself."""
+    try:
+        with open(path + SIDECAR_SUFFIX) as f:
+            record = json.load(f)
+        stat = os.stat(path)
+    except (OSError, ValueError):
+        return None
+    if stat.st_size != record.get("size") or stat.st_mtime_ns != record.get("mtime_ns"):
+        return None
+    return record
+
+def restamp(path: str, record: dict) -> dict:
+    """Re-pin a verified record after we rewrote path ourselves, e.g. to add tags.
+
+    sha256 keeps describing the bytes that were received; size and mtime
+    follow the file so verified() keeps trusting it.
+    """
+    stat = os.stat(path)
+    record = dict(record, size=stat.st_size, mtime_ns=stat.st_mtime_ns, tagged=True)
+    tmp = path + SIDECAR_SUFFIX + ".tmp"
+    with open(tmp, 'w') as f:
+        json.dump(record, f)
+    os.replace(tmp, path + SIDECAR_SUFFIX)
+    return record
+
+def remove(path: str):
+    """Delete a file together with its sidecar."""
+    for name in (path, path + SIDECAR_SUFFIX):
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,219 @@
+"""Parse Tidal playback manifests (BTS JSON and DASH MPD)."""
+
+import base64
+import json
+import re
+import time
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Hashable, Optional
+from urllib.parse import parse_qs, urljoin, urlsplit
+
+BTS_MIME = "application/vnd.tidal.bts"
+DASH_MIME = "application/dash+xml"
+
+MPD_NS = {"mpd": "urn:mpeg:dash:schema:mpd:2011"}
+TEMPLATE_VAR = re.compile(r"\$(RepresentationID|Number|Bandwidth|Time)(?:%0(\d+)d)?\$")
+EXPIRY_MARGIN = 60  # seconds before a signed URL expires that its manifest is dropped
+TOKEN_EXPIRY = re.compile(r"(?:^|~)(?:exp=)?(\d{9,11})(?:~|$)")
+ISO_DURATION = re.compile(
+    r"P(?:(?P<days>[\d.]+)D)?(?:T(?:(?P<hours>[\d.]+)H)?(?:(?P<minutes>[\d.]+)M)?(?:(?P<seconds>[\d.]+)S)?)?"
+)
+
+@dataclass(slots=True)
+class Manifest:
+    mime_type: str
+    codec: str
+    urls: list[str] = field(default_factory=list)  # BTS: one or more full-file URLs
+    init_url: Optional[str] = None  # DASH: initialization segment
+    segment_urls: list[str] = field(default_factory=list)  # DASH: media segments in order
+
+    @property
+    def segmented(self) -> bool:
+        return bool(self.segment_urls)
+
+    @property
+    def extension(self) -> str:
+        # DASH always arrives in fragmented MP4, even when the codec is FLAC
+        if self.codec.startswith("flac") and not self.segmented:
+            return "flac"
+        return "m4a"
+
+    @property
+    def expires(self) -> Optional[float]:
+        """Earliest expiry signed into any of the URLs, if one can be found."""
+        urls = self.urls + ([self.init_url] if self.init_url else []) + self.segment_urls
+        times = [t for t in map(url_expiry, urls) if t is not None]
+        return min(times, default=None)
+
+class ManifestCache:
+    """Recently resolved manifests, dropped shortly before their signed URLs expire.
+
+    Manifests whose URLs carry no recognisable expiry are kept for
+    default_ttl seconds. Lookups are in memory only; signed URLs are too
+    short-lived to be worth persisting.
+    """
+
+    def __init__(self, max_entries: int = 256, default_ttl: float = 600):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, tuple[float, Manifest]] = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Manifest]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.time():
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, manifest: Manifest):
+        expires = manifest.expires
+        if expires is None:
+            expires = time.time() + self.default_ttl
+        self._entries[key] = (expires - EXPIRY_MARGIN, manifest)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+def url_expiry(url: str) -> Optional[float]:
+    """Unix time a signed CDN URL stops working, from Expires= or an Akamai-style token."""
+    query = parse_qs(urlsplit(url).query)
+    for name in ("Expires", "expires", "exp"):
+        for value in query.get(name, ()):
+            if value.isdigit():
+                return float(value)
+    for name in ("token", "hdnts", "hdnea", "__token__"):
+        for value in query.get(name, ()):
+            match = TOKEN_EXPIRY.search(value)
+            if match:
+                return float(match.group(1))
+    return None
+
+def parse_manifest(resp_data: dict) -> Manifest:
+    """Decode the manifest of a playbackinfopostpaywall response."""
+    mime_type = resp_data.get("manifestMimeType", BTS_MIME)
+    raw = base64.b64decode(resp_data["manifest"])
+    if mime_type == DASH_MIME:
+        return parse_dash(raw.decode("utf-8"))
+
+    data = json.loads(raw.decode("utf-8"))
+    return Manifest(mime_type=mime_type, codec=data.get("codecs", ""), urls=data["urls"])
+
+def parse_dash(xml: str, base_url: str = "") -> Manifest:
+    """Expand the best representation of an MPD into init and media segment URLs."""
+    root = ET.fromstring(xml)
+    base_url = _base_url(root, base_url)
+    period = root.find("mpd:Period", MPD_NS)
+    if period is None:
+        raise ValueError("MPD has no Period")
+    base_url = _base_url(period, base_url)
+    duration = _parse_duration(period.get("duration") or root.get("mediaPresentationDuration"))
+
+    best = None
+    for adaptation in period.findall("mpd:AdaptationSet", MPD_NS):
+        for representation in adaptation.findall("mpd:Representation", MPD_NS):
+            bandwidth = int(representation.get("bandwidth", 0))
+            if best is None or bandwidth > best[0]:
+                best = (bandwidth, adaptation, representation)
+    if best is None:
+        raise ValueError("MPD has no Representation")
+    bandwidth, adaptation, representation = best
+
+    base_url = _base_url(adaptation, base_url)
+    base_url = _base_url(representation, base_url)
+    template = representation.find("mpd:SegmentTemplate", MPD_NS)
+    if template is None:
+        template = adaptation.find("mpd:SegmentTemplate", MPD_NS)
+
+    codec = representation.get("codecs") or adaptation.get("codecs") or ""
+    if template is None:
+        # Single-file representation addressed by BaseURL alone
+        return Manifest(mime_type=DASH_MIME, codec=codec, urls=[base_url])
+
+    values = {"RepresentationID": representation.get("id", ""), "Bandwidth": str(bandwidth)}
+    init_url = urljoin(base_url, _fill(template.get("initialization", ""), values))
+
+    media = template.get("media", "")
+    number = int(template.get("startNumber", 1))
+    segment_urls = []
+    for start in _segment_times(template, duration):
+        values.update(Number=str(number), Time=str(start))
+        segment_urls.append(urljoin(base_url, _fill(media, values)))
+        number += 1
+
+    return Manifest(
+        mime_type=DASH_MIME,
+        codec=codec,
+        init_url=init_url if template.get("initialization") else None,
+        segment_urls=segment_urls,
+    )
+
+def _segment_times(template: ET.Element, duration: float) -> list[int]:
+    """Start time of every media segment, from SegmentTimeline or a fixed duration."""
+    timescale = int(template.get("timescale", 1))
+    timeline = template.find("mpd:SegmentTimeline", MPD_NS)
+    if timeline is None:
+        step = int(template.get("duration", 0))
+        if not step or not duration:
+            raise ValueError("MPD SegmentTemplate has neither a timeline nor a duration")
+        count = -(-int(duration * timescale) // step)
+        return [i * step for i in range(count)]
+
+    times = []
+    time = 0
+    end = int(duration * timescale)
+    entries = timeline.findall("mpd:S", MPD_NS)
+    for index, entry in enumerate(entries):
+        time = int(entry.get("t", time))
+        length = int(entry.get("d"))
+        repeat = int(entry.get("r", 0))
+        if repeat < 0:
+            # Repeat until the next S element or the end of the period
+            next_time = int(entries[index + 1].get("t", end)) if index + 1 < len(entries) else end
+            repeat = -(-(next_time - time) // length) - 1
+        for _ in range(repeat + 1):
+            times.append(time)
+            time += length
+    return times
+
+def _fill(template: str, values: dict) -> str:
+    def replace(match):
+        value = values[match.group(1)]
+        width = match.group(2)
+        return value.zfill(int(width)) if width else value
+    return TEMPLATE_VAR.sub(replace, template).replace("$$", "$")
+
+def _base_url(element: ET.Element, parent: str) -> str:
+    node = element.find("mpd:BaseURL", MPD_NS)
+    if node is None or not (node.text or "").strip():
+        return parent
+    return urljoin(parent, node.text.strip())
+
+def _parse_duration(value: Optional[str]) -> float:
+    """Seconds in an ISO 8601 duration such as PT3M25.5S."""
+    if not value:
+        return 0.0
+    match = ISO_DURATION.fullmatch(value.strip())
+    if not match:
+        return 0.0
+    parts = {k: float(v) for k, v in match.groupdict().items() if v}
+    return (parts.get("days", 0) * 86400 + parts.get("hours", 0) * 3600
+            + parts.get("minutes", 0) * 60 + parts.get("seconds", 0))
@@ -0,0 +1,107 @@
+"""Two-tier metadata cache: in-memory LRU in front of a SQLite table."""
+
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+class MetadataCache:
+    """Caches API responses by key with a TTL.
+
+    Lookups hit a bounded LRU first and fall back to SQLite, so entries
+    survive restarts. The database is only touched from one worker thread.
+    """
+
+    def __init__(self, path: str, max_entries: int = 1024, ttl: float = 7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="metacache")
+        self._db: Optional[sqlite3.Connection] = None
+
+    async def get(self, key: str) -> Optional[dict]:
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self._memory[key]
+
+        row = await self._run(self._select, key, now)
+        if row is None:
+            self.misses += 1
+            return None
+
+        expires, value = row[0], json.loads(row[1])
+        self._remember(key, expires, value)
+        self.disk_hits += 1
+        return value
+
+    async def set(self, key: str, value: dict):
+        expires = time.time() + self.ttl
+        self._remember(key, expires, value)
+        await self._run(self._insert, key, expires, json.dumps(value))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._memory),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+    async def close(self):
+        if self._db is not None:
+            await self._run(self._db.close)
+            self._db = None
+        self._executor.shutdown(wait=False)
+
+    def _remember(self, key: str, expires: float, value: dict):
+        self._memory[key] = (expires, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS metadata "
+                "(key TEXT PRIMARY KEY, expires REAL NOT NULL, value TEXT NOT NULL)"
+            )
+        return self._db
+
+    def _select(self, key: str, now: float):
+        db = self._connect()
+        row = db.execute("SELECT expires, value FROM metadata WHERE key = ?", (key,)).fetchone()
+        if row is not None and row[0] <= now:
+            with db:
+                db.execute("DELETE FROM metadata WHERE key = ?", (key,))
+            return None
+        return row
+
+    def _insert(self, key: str, expires: float, value: str):
+        db = self._connect()
+        with db:
+            db.execute(
+                "INSERT OR REPLACE INTO metadata (key, expires, value) VALUES (?, ?, ?)",
+                (key, expires, value),
+            )
@@ -0,0 +1,109 @@
+"""Rate-limited progress reporting with speed and ETA."""
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+SPEED_SMOOTHING = 0.3  # weight of the newest sample in the moving average
+
+@dataclass(slots=True)
+class ProgressUpdate:
+    done: int
+    total: int  # 0 while unknown
+    speed: float  # bytes per second, smoothed
+    elapsed: float
+
+    @property
+    def percent(self) -> Optional[float]:
+        return self.done / self.total * 100 if self.total else None
+
+    @property
+    def eta(self) -> Optional[float]:
+        if not self.total or not self.speed:
+            return None
+        return max(0.0, (self.total - self.done) / self.speed)
+
+    def describe(self) -> str:
+        """One line such as '45.0% of 32.1 MB · 3.10 MB/s · ETA 0:12'."""
+        mb = 1024 * 1024
+        if self.total:
+            text = f"{self.percent:.1f}% of {self.total / mb:.1f} MB"
+        else:
+            text = f"{self.done / mb:.1f} MB"
+        text += f" · {self.speed / mb:.2f} MB/s"
+        if self.eta is not None:
+            minutes, seconds = divmod(int(self.eta), 60)
+            text += f" · ETA {minutes}:{seconds:02d}"
+        return text
+
+class Progress:
+    """Byte-count callback that hands render() a snapshot at most every interval seconds.
+
+    Pass an instance wherever a download callback is expected. render may
+    be a plain function or a coroutine function; while an async render is
+    still running, newer snapshots are skipped rather than queued, so a
+    slow renderer never holds up the transfer.
+    """
+
+    def __init__(self, render: Callable[[ProgressUpdate], Any], total: int = 0,
+                 interval: float = 0.5):
+        self.render = render
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.resumed = 0  # part of done that came from an earlier run
+        self.speed = 0.0
+        self._started = time.monotonic()
+        self._emitted_at = self._started
+        self._emitted_bytes = 0
+        self._pending: Optional[asyncio.Task] = None
+
+    def __call__(self, size: int):
+        self.done += size
+        now = time.monotonic()
+        if now - self._emitted_at >= self.interval:
+            self._emit(now)
+
+    def resume(self, size: int):
+        """Count bytes left by an earlier run without treating them as speed."""
+        self.done += size
+        self.resumed += size
+        self._emitted_bytes += size
+
+    def _emit(self, now: float):
+        window = now - self._emitted_at
+        if window > 0:
+            sample = (self.done - self._emitted_bytes) / window
+            self.speed = sample if not self.speed else (
+                SPEED_SMOOTHING * sample + (1 - SPEED_SMOOTHING) * self.speed
+            )
+        self._emitted_at = now
+        self._emitted_bytes = self.done
+
+        if self._pending is not None and not self._pending.done():
+            return
+        result = self.render(self.snapshot(now))
+        if asyncio.iscoroutine(result):
+            self._pending = asyncio.ensure_future(result)
+
+    def snapshot(self, now: Optional[float] = None) -> ProgressUpdate:
+        now = time.monotonic() if now is None else now
+        return ProgressUpdate(self.done, self.total, self.speed, now - self._started)
+
+    async def close(self, final: bool = True):
+        """Wait for a running render, then optionally render the final state."""
+        if self._pending is not None:
+            await asyncio.gather(self._pending, return_exceptions=True)
+            self._pending = None
+        if final:
+            elapsed = time.monotonic() - self._started
+            if elapsed > 0:
+                self.speed = (self.done - self.resumed) / elapsed
+            result = self.render(self.snapshot())
+            if asyncio.iscoroutine(result):
+                await result
+
+def print_progress(update: ProgressUpdate):
+    """CLI renderer: rewrite one terminal line in place."""
+    print(f"\rProgress: {update.describe()}\033[K", end="", flush=True)
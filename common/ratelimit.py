@@ -0,0 +1,79 @@
+"""Shared token-bucket rate limiter for Tidal API calls."""
+
+import asyncio
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+BURST_SECONDS = 5  # bucket holds this many seconds worth of requests
+DEFAULT_RETRY_AFTER = 5.0
+
+class RateLimiter:
+    """Token bucket that every API call goes through.
+
+    API requests take one token each. CDN transfers never wait on it;
+    they have their own connection pool (see session.py), so they can't
+    hold up API calls. A 429 pauses every API call for its Retry-After
+    and halves the refill rate, which then creeps back up with every
+    successful call (AIMD), so sustained throughput settles at the most
+    the API will accept.
+    """
+
+    def __init__(self, requests_per_minute: int):
+        self.max_rate = requests_per_minute / 60
+        self.rate = self.max_rate
+        self.capacity = max(1.0, self.max_rate * BURST_SECONDS)
+        self.throttled = 0  # 429 responses seen
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait for a token for one API request."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._blocked_until - now
+                if wait <= 0 and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep(max(wait, (1 - self._tokens) / self.rate))
+
+    def backoff(self, retry_after: float = DEFAULT_RETRY_AFTER):
+        """Pause all API calls after a 429 and slow the refill rate."""
+        self.throttled += 1
+        self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+        self._tokens = 0
+        self.rate = max(self.max_rate / 16, self.rate / 2)
+
+    def success(self):
+        """Recover the refill rate a little after a call that wasn't throttled."""
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+def parse_retry_after(value: Optional[str], default: float = DEFAULT_RETRY_AFTER) -> float:
+    """Parse a Retry-After header given in seconds or as an HTTP date."""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+_shared: dict[int, RateLimiter] = {}
+
+def shared_limiter(requests_per_minute: int) -> RateLimiter:
+    """Return the process-wide limiter for this budget, creating it on first use."""
+    if requests_per_minute not in _shared:
+        _shared[requests_per_minute] = RateLimiter(requests_per_minute)
+    return _shared[requests_per_minute]
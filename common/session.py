@@ -0,0 +1,97 @@
+"""Shared aiohttp sessions with tuned connection pools."""
+
+import aiohttp
+from typing import Optional
+
+class PoolStats:
+    """Counts requests and whether they opened a new connection or reused one."""
+
+    def __init__(self):
+        self.requests = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.dns_cache_hits = 0
+        self.dns_cache_misses = 0
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(self._count("requests"))
+        trace.on_connection_create_end.append(self._count("connections_created"))
+        trace.on_connection_reuseconn.append(self._count("connections_reused"))
+        trace.on_dns_cache_hit.append(self._count("dns_cache_hits"))
+        trace.on_dns_cache_miss.append(self._count("dns_cache_misses"))
+        return trace
+
+    def _count(self, name: str):
+        async def handler(session, context, params):
+            setattr(self, name, getattr(self, name) + 1)
+        return handler
+
+    def as_dict(self) -> dict:
+        opened = self.connections_created + self.connections_reused
+        return {
+            "requests": self.requests,
+            "connections_created": self.connections_created,
+            "connections_reused": self.connections_reused,
+            "reuse_ratio": self.connections_reused / opened if opened else 0.0,
+            "dns_cache_hits": self.dns_cache_hits,
+            "dns_cache_misses": self.dns_cache_misses,
+        }
+
+class SessionFactory:
+    """Owns the sessions used for auth, API and CDN traffic.
+
+    Auth and API calls share one small keep-alive pool. CDN transfers get a
+    separate, wider pool, so bulk downloads can never take the connections
+    API calls need. Sessions are created lazily on first use, inside the
+    running event loop.
+    """
+
+    def __init__(self, verify_ssl: bool = True, api_connections: int = 10,
+                 cdn_connections: int = 32, cdn_connections_per_host: int = 8,
+                 keepalive_timeout: float = 60, dns_cache_ttl: int = 300):
+        self.verify_ssl = verify_ssl
+        self.api_connections = api_connections
+        self.cdn_connections = cdn_connections
+        self.cdn_connections_per_host = cdn_connections_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.api_stats = PoolStats()
+        self.cdn_stats = PoolStats()
+        self._api: Optional[aiohttp.ClientSession] = None
+        self._cdn: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def api(self) -> aiohttp.ClientSession:
+        """Session for auth and API hosts; carries the bearer token."""
+        if self._api is None or self._api.closed:
+            self._api = self._create(self.api_connections, self.api_connections, self.api_stats)
+        return self._api
+
+    @property
+    def cdn(self) -> aiohttp.ClientSession:
+        """Session for signed CDN URLs; never carries the bearer token."""
+        if self._cdn is None or self._cdn.closed:
+            self._cdn = self._create(
+                self.cdn_connections, self.cdn_connections_per_host, self.cdn_stats
+            )
+        return self._cdn
+
+    def _create(self, limit: int, limit_per_host: int, stats: PoolStats) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=limit,
+            limit_per_host=limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.dns_cache_ttl,
+            ssl=None if self.verify_ssl else False,
+        )
+        return aiohttp.ClientSession(connector=connector, trace_configs=[stats.trace_config()])
+
+    def stats(self) -> dict:
+        return {"api": self.api_stats.as_dict(), "cdn": self.cdn_stats.as_dict()}
+
+    async def close(self):
+        for session in (self._api, self._cdn):
+            if session is not None and not session.closed:
+                await session.close()
+        self._api = self._cdn = None
@@ -0,0 +1,353 @@
+"""Write tags and cover art into FLAC and MP4 files without a tagging library.
+
+FLAC tags go into VORBIS_COMMENT and PICTURE blocks. When the existing
+metadata area (including PADDING) is big enough, only that area is
+overwritten and the audio frames are never touched; otherwise the file is
+rewritten once with PADDING_SIZE bytes of headroom so the next retag fits.
+MP4 tags go into moov/udta/meta/ilst. If moov sits at the end of the file
+it is replaced in place; if it precedes mdat the file is rewritten and
+the chunk offsets are shifted. Fragmented MP4 (DASH) is left alone.
+"""
+
+import asyncio
+import os
+import shutil
+import struct
+from collections import OrderedDict
+from typing import Optional
+
+import aiohttp
+
+from .integrity import restamp, verified
+from .session import SessionFactory
+
+COVER_URL = "https://resources.tidal.com/images/{path}/{size}x{size}.jpg"
+VENDOR = b"hifi_prikolist"
+PADDING_SIZE = 4096
+
+FLAC_PADDING = 1
+FLAC_VORBIS_COMMENT = 4
+FLAC_PICTURE = 6
+
+MP4_CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl", b"udta", b"edts"}
+
+class CoverCache:
+    """Album covers by cover id, fetched once and kept under a byte budget.
+
+    Concurrent requests for the same cover share one fetch, so a batch of
+    tracks from one album downloads its artwork a single time.
+    """
+
+    def __init__(self, sessions: SessionFactory, max_bytes: int = 32 * 1024 ** 2,
+                 size: int = 1280):
+        self.sessions = sessions
+        self.max_bytes = max_bytes
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._bytes = 0
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    async def get(self, cover_id: str) -> Optional[bytes]:
+        if cover_id in self._entries:
+            self._entries.move_to_end(cover_id)
+            self.hits += 1
+            return self._entries[cover_id]
+
+        self.misses += 1
+        task = self._inflight.get(cover_id)
+        if task is None:
+            task = asyncio.create_task(self._fetch(cover_id))
+            self._inflight[cover_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(cover_id, None))
+        # Shielded so one caller giving up doesn't cancel the fetch for the others
+        return await asyncio.shield(task)
+
+    async def _fetch(self, cover_id: str) -> Optional[bytes]:
+        url = COVER_URL.format(path=cover_id.replace("-", "/"), size=self.size)
+        try:
+            async with self.sessions.cdn.get(url) as resp:
+                if resp.status != 200:
+                    return None
+                data = await resp.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Cover {cover_id} unavailable: {e}")
+            return None
+
+        if len(data) <= self.max_bytes:
+            self._entries[cover_id] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+        return data
+
+def tags_from_metadata(metadata: dict) -> dict[str, str]:
+    """Map a Tidal track object onto common tag names."""
+    title = metadata.get("title", "")
+    if metadata.get("version"):
+        title = f"{title} ({metadata['version']})"
+    artists = [a["name"] for a in metadata.get("artists", []) if a.get("name")]
+    if not artists and metadata.get("artist", {}).get("name"):
+        artists = [metadata["artist"]["name"]]
+    album = metadata.get("album", {})
+
+    tags = {
+        "TITLE": title,
+        "ARTIST": ", ".join(artists),
+        "ALBUM": album.get("title", ""),
+        "TRACKNUMBER": str(metadata.get("trackNumber", "")),
+        "DISCNUMBER": str(metadata.get("volumeNumber", "")),
+        "DATE": (metadata.get("streamStartDate") or "")[:10],
+        "ISRC": metadata.get("isrc", ""),
+        "COPYRIGHT": metadata.get("copyright", ""),
+    }
+    return {key: value for key, value in tags.items() if value}
+
+async def tag_file(path: str, extension: str, tags: dict[str, str],
+                   cover: Optional[bytes] = None) -> bool:
+    """Tag path off the event loop; returns False if the format isn't supported."""
+    return await asyncio.get_running_loop().run_in_executor(
+        None, _tag_file, path, extension, tags, cover
+    )
+
+def _tag_file(path: str, extension: str, tags: dict[str, str], cover: Optional[bytes]) -> bool:
+    record = verified(path)
+    if extension == "flac":
+        tag_flac(path, tags, cover)
+    elif extension in ("m4a", "mp4"):
+        if not tag_mp4(path, tags, cover):
+            return False
+    else:
+        return False
+    if record is not None:
+        # The file changed on purpose; keep its integrity record valid
+        restamp(path, record)
+    return True
+
+# FLAC
+
+def tag_flac(path: str, tags: dict[str, str], cover: Optional[bytes] = None):
+    with open(path, 'rb') as f:
+        if f.read(4) != b"fLaC":
+            raise ValueError(f"{path} is not a FLAC file")
+        kept = []
+        last = False
+        while not last:
+            header = f.read(4)
+            if len(header) < 4:
+                raise ValueError(f"{path} has a truncated metadata block")
+            last = bool(header[0] & 0x80)
+            kind = header[0] & 0x7F
+            length = int.from_bytes(header[1:], "big")
+            if kind in (FLAC_PADDING, FLAC_VORBIS_COMMENT, FLAC_PICTURE):
+                f.seek(length, os.SEEK_CUR)
+            else:
+                kept.append((kind, f.read(length)))
+        audio_offset = f.tell()
+
+    blocks = kept + [(FLAC_VORBIS_COMMENT, _vorbis_comment(tags))]
+    if cover:
+        blocks.append((FLAC_PICTURE, _flac_picture(cover)))
+
+    available = audio_offset - 4
+    needed = sum(4 + len(data) for _, data in blocks)
+    if needed == available or needed + 4 <= available:
+        # Fits in the old metadata area: overwrite it, leave the audio alone
+        if needed < available:
+            blocks.append((FLAC_PADDING, bytes(available - needed - 4)))
+        with open(path, 'r+b') as f:
+            f.seek(4)
+            f.write(_flac_blocks(blocks))
+        return
+
+    blocks.append((FLAC_PADDING, bytes(PADDING_SIZE)))
+    _rewrite(path, 0, b"fLaC" + _flac_blocks(blocks), audio_offset)
+
+def _flac_blocks(blocks: list[tuple[int, bytes]]) -> bytes:
+    out = bytearray()
+    for index, (kind, data) in enumerate(blocks):
+        flag = 0x80 if index == len(blocks) - 1 else 0
+        out += bytes([flag | kind]) + len(data).to_bytes(3, "big") + data
+    return bytes(out)
+
+def _vorbis_comment(tags: dict[str, str]) -> bytes:
+    out = bytearray(struct.pack("<I", len(VENDOR)) + VENDOR)
+    out += struct.pack("<I", len(tags))
+    for key, value in tags.items():
+        entry = f"{key}={value}".encode("utf-8")
+        out += struct.pack("<I", len(entry)) + entry
+    return bytes(out)
+
+def _flac_picture(image: bytes) -> bytes:
+    mime = _image_mime(image).encode()
+    width, height = _image_size(image)
+    return (
+        struct.pack(">II", 3, len(mime)) + mime  # 3 = front cover
+        + struct.pack(">I", 0)  # empty description
+        + struct.pack(">IIIII", width, height, 24, 0, len(image))
+        + image
+    )
+
+def _image_mime(image: bytes) -> str:
+    return "image/png" if image.startswith(b"\x89PNG") else "image/jpeg"
+
+def _image_size(image: bytes) -> tuple[int, int]:
+    """Width and height from a PNG or JPEG header, (0, 0) if unknown."""
+    if image.startswith(b"\x89PNG") and len(image) >= 24:
+        return struct.unpack(">II", image[16:24])
+    position = 2
+    while position + 9 < len(image):
+        if image[position] != 0xFF:
+            break
+        marker = image[position + 1]
+        length = struct.unpack(">H", image[position + 2:position + 4])[0]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">HH", image[position + 5:position + 9])
+            return width, height
+        position += 2 + length
+    return 0, 0
+
+# MP4
+
+def tag_mp4(path: str, tags: dict[str, str], cover: Optional[bytes] = None) -> bool:
+    """Replace moov/udta/meta; returns False for fragmented files."""
+    atoms = _top_level_atoms(path)
+    kinds = [kind for kind, _, _ in atoms]
+    if b"moov" not in kinds or b"moof" in kinds:
+        return False
+    index = kinds.index(b"moov")
+    _, moov_start, moov_end = atoms[index]
+    with open(path, 'rb') as f:
+        f.seek(moov_start)
+        moov = f.read(moov_end - moov_start)
+
+    new_moov = bytearray(_replace_udta(moov, tags, cover))
+    delta = len(new_moov) - len(moov)
+    mdat_before = any(kind == b"mdat" and start < moov_start for kind, start, _ in atoms)
+    if not mdat_before and delta:
+        # Sample data comes after moov and moves by delta
+        _shift_chunk_offsets(new_moov, 8, len(new_moov), delta)
+
+    if index == len(atoms) - 1:
+        with open(path, 'r+b') as f:
+            f.seek(moov_start)
+            f.write(new_moov)
+            f.truncate()
+        return True
+
+    _rewrite(path, moov_start, bytes(new_moov), moov_end)
+    return True
+
+def _top_level_atoms(path: str) -> list[tuple[bytes, int, int]]:
+    atoms = []
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        position = 0
+        while position + 8 <= size:
+            f.seek(position)
+            length, kind = struct.unpack(">I4s", f.read(8))
+            if length == 1:
+                length = struct.unpack(">Q", f.read(8))[0]
+            elif length == 0:
+                length = size - position
+            if length < 8:
+                raise ValueError(f"{path} has a malformed {kind!r} atom")
+            atoms.append((kind, position, position + length))
+            position += length
+    return atoms
+
+def _children(data: bytes, start: int, end: int):
+    """Yield (kind, start, end, header_size) for atoms inside data[start:end]."""
+    while start + 8 <= end:
+        length, kind = struct.unpack(">I4s", data[start:start + 8])
+        header = 8
+        if length == 1:
+            length = struct.unpack(">Q", data[start + 8:start + 16])[0]
+            header = 16
+        if length < header or start + length > end:
+            raise ValueError(f"Malformed {kind!r} atom")
+        yield kind, start, start + length, header
+        start += length
+
+def _atom(kind: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+def _replace_udta(moov: bytes, tags: dict[str, str], cover: Optional[bytes]) -> bytes:
+    header = 16 if struct.unpack(">I", moov[:4])[0] == 1 else 8
+    body = bytearray()
+    udta_rest = b""
+    for kind, start, end, child_header in _children(moov, header, len(moov)):
+        if kind == b"udta":
+            # Keep whatever else lives in udta, e.g. chapters
+            udta_rest = b"".join(
+                moov[s:e] for k, s, e, _ in _children(moov, start + child_header, end) if k != b"meta"
+            )
+        else:
+            body += moov[start:end]
+    body += _atom(b"udta", udta_rest + _ilst_meta(tags, cover))
+    return _atom(b"moov", bytes(body))
+
+def _ilst_meta(tags: dict[str, str], cover: Optional[bytes]) -> bytes:
+    names = {"TITLE": b"\xa9nam", "ARTIST": b"\xa9ART", "ALBUM": b"\xa9alb",
+             "DATE": b"\xa9day", "COPYRIGHT": b"cprt"}
+    items = bytearray()
+    for key, kind in names.items():
+        if key in tags:
+            items += _atom(kind, _data(1, tags[key].encode("utf-8")))
+    if tags.get("TRACKNUMBER", "").isdigit():
+        items += _atom(b"trkn", _data(0, struct.pack(">HHHH", 0, int(tags["TRACKNUMBER"]), 0, 0)))
+    if tags.get("DISCNUMBER", "").isdigit():
+        items += _atom(b"disk", _data(0, struct.pack(">HHH", 0, int(tags["DISCNUMBER"]), 0)))
+    if "ISRC" in tags:
+        items += _atom(b"----", _atom(b"mean", bytes(4) + b"com.apple.iTunes")
+                       + _atom(b"name", bytes(4) + b"ISRC")
+                       + _data(1, tags["ISRC"].encode("utf-8")))
+    if cover:
+        items += _atom(b"covr", _data(14 if _image_mime(cover) == "image/png" else 13, cover))
+
+    handler = _atom(b"hdlr", bytes(8) + b"mdirappl" + bytes(9))
+    return _atom(b"meta", bytes(4) + handler + _atom(b"ilst", bytes(items)))
+
+def _data(kind: int, payload: bytes) -> bytes:
+    return _atom(b"data", struct.pack(">II", kind, 0) + payload)
+
+def _shift_chunk_offsets(moov: bytearray, start: int, end: int, delta: int):
+    for kind, child_start, child_end, header in _children(moov, start, end):
+        if kind in MP4_CONTAINERS:
+            _shift_chunk_offsets(moov, child_start + header, child_end, delta)
+        elif kind in (b"stco", b"co64"):
+            width, fmt = (4, ">I") if kind == b"stco" else (8, ">Q")
+            count = struct.unpack(">I", moov[child_start + header + 4:child_start + header + 8])[0]
+            position = child_start + header + 8
+            for _ in range(count):
+                value = struct.unpack(fmt, moov[position:position + width])[0]
+                moov[position:position + width] = struct.pack(fmt, value + delta)
+                position += width
+
+# Shared
+
+def _rewrite(path: str, keep: int, insert: bytes, tail_offset: int):
+    """Write the first keep bytes, then insert, then the old file from tail_offset on, and swap it in."""
+    tmp = path + ".tagging"
+    try:
+        with open(path, 'rb') as src, open(tmp, 'wb') as dst:
+            _copy(src, dst, 0, keep)
+            dst.write(insert)
+            src.seek(tail_offset)
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def _copy(src, dst, start: int, length: int):
+    src.seek(start)
+    while length > 0:
+        block = src.read(min(1024 * 1024, length))
+        if not block:
+            break
+        dst.write(block)
+        length -= len(block)
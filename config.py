@@ -11,6 +11,9 @@ class TidalConfig:
     access_token: str = ""
     refresh_token: str = ""
     token_expiry: str = "0"
+    refresh_margin: int = 3600  # seconds before expiry the token is renewed
+    api_url: str = "https://api.tidalhifi.com/v1"
+    auth_url: str = "https://auth.tidal.com/v1/oauth2"
     quality: int = 2  # HiFi FLAC
 
 @dataclass(slots=True)
@@ -18,15 +21,50 @@ class DownloadsConfig:
     folder: str = ""
     verify_ssl: bool = True
     requests_per_minute: int = 100
+    segments: int = 1  # parallel Range requests per file, 1 = single stream
+    dash_window: int = 4  # DASH segments fetched ahead of the writer
+    chunk_size: int = 64 * 1024  # network read size
+    write_buffer_size: int = 1024 * 1024  # bytes accumulated per disk write
+    retries: int = 3  # resumed attempts after a dropped connection
+    progress_interval: float = 0.5  # seconds between progress redraws
+    tag_files: bool = True  # write tags and cover art after download
+    cover_size: int = 1280  # pixels, one of Tidal's square image sizes
+    api_connections: int = 10  # pool shared by auth and API calls
+    cdn_connections: int = 32  # separate pool for CDN transfers
+    cdn_connections_per_host: int = 8
+    keepalive_timeout: float = 60  # seconds an idle connection is kept
+    dns_cache_ttl: int = 300  # seconds
+
+@dataclass(slots=True)
+class CacheConfig:
+    path: str = ""  # SQLite file shared by the persistent caches
+    metadata_entries: int = 1024  # in-memory LRU size
+    metadata_ttl: int = 7 * 24 * 3600  # seconds
+    manifest_entries: int = 256  # resolved playback manifests kept in memory
+    manifest_ttl: int = 600  # seconds, for URLs without a signed expiry
+    cover_bytes: int = 32 * 1024 * 1024  # album art kept in memory
+
+@dataclass(slots=True)
+class DaemonConfig:
+    socket: str = ""  # Unix socket the daemon listens on and the CLI looks for
+    max_jobs: int = 4  # CLI jobs run at the same time; later ones wait
 
 @dataclass(slots=True)
 class Config:
     tidal: TidalConfig
     downloads: DownloadsConfig
+    cache: CacheConfig
+    daemon: DaemonConfig
     
     def __init__(self):
         HOME = Path.home()
         self.downloads = DownloadsConfig(
             folder=os.path.join(HOME, "StreamripDownloads")
         )
-        self.tidal = TidalConfig()
\ No newline at end of file
+        self.tidal = TidalConfig()
+        self.cache = CacheConfig(
+            path=os.path.join(HOME, ".cache", "streamrip-tidal.db")
+        )
+        self.daemon = DaemonConfig(
+            socket=os.path.join(HOME, ".cache", "streamrip-tidal.sock")
+        )
\ No newline at end of file
@@ -0,0 +1,147 @@
+"""Long-running process that keeps one logged-in TidalClient warm for cli.py.
+
+The CLI connects to a Unix socket, sends one JSON line describing the job
+and reads newline-delimited JSON back: {"out": text, "end": end} for each
+line of output, then {"exit": status}. Closing the connection cancels the
+job. When no daemon is listening the CLI runs the job itself; the client
+side is cli.submit().
+"""
+
+import asyncio
+import json
+import os
+import signal
+import socket
+
+import click
+
+import cli
+from config import Config
+from tidal import TidalClient
+
+class Daemon:
+    """Serves CLI jobs on a Unix socket with one shared client, caches and pools."""
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.client = TidalClient(config)
+        self.slots = asyncio.Semaphore(max(1, config.daemon.max_jobs))
+        self._jobs: set[asyncio.Task] = set()
+
+    async def serve(self):
+        path = self.config.daemon.socket
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if os.path.exists(path):
+            if _listening(path):
+                raise click.ClickException(f"A daemon is already listening on {path}")
+            os.remove(path)  # left behind by a daemon that didn't shut down cleanly
+
+        print("Logging in to Tidal...")
+        await self.client.login()
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+        server = await asyncio.start_unix_server(self._handle, path)
+        # Anyone who can connect can spend our account's quota
+        os.chmod(path, 0o600)
+        print(f"Daemon listening on {path}")
+        try:
+            await stop.wait()
+        finally:
+            server.close()
+            for job in self._jobs:
+                job.cancel()
+            await asyncio.gather(*self._jobs, return_exceptions=True)
+            await server.wait_closed()
+            if os.path.exists(path):
+                os.remove(path)
+            await self.client.close()
+            print("Daemon stopped")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        def send(message: dict):
+            if not writer.is_closing():
+                writer.write(json.dumps(message).encode() + b"\n")
+
+        def echo(text="", end="\n"):
+            send({"out": str(text), "end": end})
+
+        try:
+            job = json.loads(await reader.readline())
+        except ValueError:
+            send({"out": "Bad request", "end": "\n"})
+            send({"exit": 2})
+            writer.close()
+            return
+
+        task = asyncio.create_task(self._run(job, echo))
+        self._jobs.add(task)
+        task.add_done_callback(self._jobs.discard)
+        # The CLI sends nothing after the job, so EOF means it went away
+        hangup = asyncio.create_task(reader.read())
+        await asyncio.wait((task, hangup), return_when=asyncio.FIRST_COMPLETED)
+
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        else:
+            hangup.cancel()
+            status = 1 if task.cancelled() or task.exception() else task.result()
+            send({"exit": status})
+        await asyncio.gather(hangup, return_exceptions=True)
+        try:
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+    async def _run(self, job: dict, echo) -> int:
+        if self.slots.locked():
+            echo("Waiting for a running job to finish...")
+        async with self.slots:
+            try:
+                ok = await cli.run_job(
+                    self.client,
+                    self.config,
+                    job.get("track_ids", []),
+                    job.get("quality", self.config.tidal.quality),
+                    job.get("output"),
+                    job.get("segments", 1),
+                    job.get("albums", ()),
+                    job.get("playlists", ()),
+                    job.get("concurrency", 4),
+                    echo,
+                )
+            except Exception as e:
+                echo(f"Error: {e}")
+                return 1
+        return 0 if ok else 1
+
+def _listening(path: str) -> bool:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+@click.command()
+@click.option('--socket', 'socket_path', type=click.Path(), help='Unix socket to listen on (default from config)')
+@click.option('--max-jobs', type=int, help='CLI jobs run at the same time')
+def main(socket_path, max_jobs):
+    """Keep a logged-in Tidal session warm and run cli.py jobs on it."""
+    config = Config()
+    if socket_path:
+        config.daemon.socket = socket_path
+    if max_jobs:
+        config.daemon.max_jobs = max_jobs
+    asyncio.run(Daemon(config).serve())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+"""Put the repository root and bot/ on sys.path, as cli.py and bot.py run them."""
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "bot"))
@@ -0,0 +1,20 @@
+"""Local HTTP stand-ins for the Tidal API and CDN."""
+
+from contextlib import asynccontextmanager
+
+from aiohttp import web
+
+@asynccontextmanager
+async def serve(handler):
+    """Serve every path with handler on a free local port; yields the base URL."""
+    app = web.Application()
+    app.router.add_route("*", "/{tail:.*}", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,63 @@
+"""Worker-process account pools that pick up tokens another process saved."""
+
+import asyncio
+import time
+
+from aiohttp import web
+
+from config import Config, TidalTokens
+from helpers import serve
+from tidal_client import TidalClient
+
+def saved(access_token: str) -> TidalTokens:
+    return TidalTokens(access_token, "refresh", "1", "US", time.time() + 3600)
+
+def test_worker_adopts_account_saved_after_start(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    seen = []
+
+    async def handler(request):
+        seen.append(request.headers.get("authorization"))
+        return web.json_response({"id": 1})
+
+    async def main():
+        async with serve(handler) as url:
+            client = TidalClient(Config(), refresh=False)
+            try:
+                assert not await client.login()
+                assert client.session is None
+                # The front process finishes a /login and saves the pool
+                Config().save_accounts([saved("first")])
+                await client.auth.reload()
+                assert client.session is not None
+                async with client.request("GET", f"{url}/tracks/1", params={"countryCode": "US"}) as resp:
+                    assert resp.status == 200
+            finally:
+                await client.close()
+
+    asyncio.run(main())
+    assert seen == ["Bearer first"]
+
+def test_worker_reloads_tokens_on_401(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    seen = []
+
+    async def handler(request):
+        token = request.headers.get("authorization")
+        seen.append(token)
+        return web.json_response({}, status=200 if token == "Bearer second" else 401)
+
+    async def main():
+        Config().save_accounts([saved("first")])
+        async with serve(handler) as url:
+            client = TidalClient(Config(), refresh=False)
+            try:
+                # The front process refreshes the token after the worker loaded it
+                Config().save_accounts([saved("second")])
+                async with client.request("GET", f"{url}/tracks/1") as resp:
+                    assert resp.status == 200
+            finally:
+                await client.close()
+
+    asyncio.run(main())
+    assert seen == ["Bearer first", "Bearer second"]
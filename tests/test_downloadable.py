@@ -0,0 +1,32 @@
+"""Downloadable against a CDN whose HEAD requests fail."""
+
+import asyncio
+
+import aiohttp
+from aiohttp import web
+
+from common.downloadable import Downloadable
+from common.integrity import verified
+from helpers import serve
+
+BODY = b"fLaC" + bytes(range(256)) * 8192  # 2 MiB behind a FLAC header
+
+async def cdn(request):
+    if request.method == "HEAD":
+        # e.g. a signed URL only valid for GET, or an expired one
+        return web.Response(status=403, text="Forbidden")
+    return web.Response(body=BODY)
+
+def test_failed_head_falls_back_to_plain_get(tmp_path):
+    path = str(tmp_path / "track.flac")
+
+    async def main():
+        async with serve(cdn) as url, aiohttp.ClientSession() as session:
+            downloadable = Downloadable(session, f"{url}/track.flac", "flac", segments=4)
+            assert await downloadable.size() == 0
+            await downloadable.download(path, lambda n: None)
+
+    asyncio.run(main())
+    with open(path, "rb") as f:
+        assert f.read() == BODY
+    assert verified(path)
@@ -0,0 +1,48 @@
+"""QualityPlanner remembering probed sizes in its own store."""
+
+import asyncio
+
+from common.metacache import MetadataCache
+from planner import QualityPlanner
+from sizes import TrackSizes
+
+class Probed:
+    def __init__(self, size: int):
+        self._size = size
+
+    async def size(self) -> int:
+        return self._size
+
+class Client:
+    """Just enough of TidalClient for the planner: a borderline track needs a probe."""
+
+    def __init__(self, path: str):
+        self.metadata = MetadataCache(path)
+        self.probes = 0
+
+    async def resolve_track(self, track_id, quality, track_info):
+        self.probes += 1
+        return Probed(40 * 1024 ** 2), "track.flac"
+
+def test_probed_size_is_reused_without_touching_metadata(tmp_path):
+    path = str(tmp_path / "cache.db")
+    track_info = {"duration": 300, "audioQuality": "LOSSLESS"}
+
+    async def main():
+        client = Client(path)
+        sizes = TrackSizes(path)
+        planner = QualityPlanner(50 * 1024 ** 2, 2, sizes)
+        try:
+            first = await planner.plan(client, "1", track_info)
+            second = await planner.plan(client, "1", track_info)
+            assert (first.quality, first.size) == (2, 40 * 1024 ** 2)
+            assert (second.quality, second.size, second.resolved) == (2, 40 * 1024 ** 2, None)
+            assert client.probes == 1
+            assert await sizes.get("1", 2) == 40 * 1024 ** 2
+            assert client.metadata.stats()["entries"] == 0
+            assert client.metadata.misses == 0
+        finally:
+            await client.metadata.close()
+            await sizes.close()
+
+    asyncio.run(main())
@@ -0,0 +1,31 @@
+"""StreamInputFile when its library copy can't be written."""
+
+import asyncio
+
+import pytest
+
+from common.filesink import FileSink
+from streaming import StreamInputFile
+
+class Source:
+    """Stands in for a Downloadable: a FLAC header and some audio."""
+    chunk_size = 4
+    buffer_size = 16
+    extension = "flac"
+
+    async def iter_chunks(self):
+        yield b"fLaC" + bytes(12)
+
+def test_failed_tee_open_surfaces_its_own_error(tmp_path, monkeypatch):
+    async def full(self):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(FileSink, "open", full)
+    upload = StreamInputFile(Source(), "track.flac", 16, tee_path=str(tmp_path / "track.flac"))
+
+    async def main():
+        return [chunk async for chunk in upload.read(None)]
+
+    with pytest.raises(OSError, match="No space left"):
+        asyncio.run(main())
+    assert not upload.teed
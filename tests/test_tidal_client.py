@@ -0,0 +1,38 @@
+"""TidalClient caches when pooled accounts sit in different countries."""
+
+import asyncio
+import time
+
+from aiohttp import web
+
+import tidal_client
+from config import Config, TidalTokens
+from helpers import serve
+from tidal_client import TidalClient
+
+def test_track_info_cached_under_serving_accounts_country(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    expiry = time.time() + 86400
+    Config().save_accounts([
+        TidalTokens("us", "refresh", "1", "US", expiry),
+        TidalTokens("de", "refresh", "2", "DE", expiry),
+    ])
+
+    async def handler(request):
+        return web.json_response({"id": 1, "countryCode": request.query["countryCode"]})
+
+    async def main():
+        async with serve(handler) as url:
+            monkeypatch.setattr(tidal_client, "BASE", url)
+            client = TidalClient(Config())
+            try:
+                assert await client.login()
+                client.auth.accounts[0].active = 5  # busy, so the DE account serves
+                info = await client.get_track_info("1")
+                assert info["countryCode"] == "DE"
+                assert await client.metadata.get("track:1:DE") == info
+                assert await client.metadata.get("track:1:US") is None
+            finally:
+                await client.close()
+
+    asyncio.run(main())
@@ -1,16 +1,19 @@
 import asyncio
 import base64
-import json
 import time
 import aiohttp
+from contextlib import asynccontextmanager
+from typing import Optional
 
 from config import Config
 from client import Client
-from downloadable import Downloadable
+from common.downloadable import Downloadable
+from common.manifest import Manifest, ManifestCache, parse_manifest
 from exceptions import AuthenticationError, NonStreamableError
-
-BASE = "https://api.tidalhifi.com/v1"
-AUTH_URL = "https://auth.tidal.com/v1/oauth2"
+from common.metacache import MetadataCache
+from common.ratelimit import parse_retry_after, shared_limiter
+from common.session import SessionFactory
+from common.tagging import CoverCache, tag_file, tags_from_metadata
 
 CLIENT_ID = base64.b64decode("ZlgySnhkbW50WldLMGl4VA==").decode("iso-8859-1")
 CLIENT_SECRET = base64.b64decode(
@@ -25,31 +28,148 @@ QUALITY_MAP = {
     3: "HI_RES",  # MQA
 }
 
+MAX_THROTTLE_RETRIES = 5
+REFRESH_CHECK_INTERVAL = 300  # seconds between expiry checks in the background refresher
+REFRESH_RETRY_DELAY = 60  # seconds before retrying a failed background refresh
+
 class TidalClient(Client):
     source = "tidal"
     max_quality = 3
 
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, sessions: Optional[SessionFactory] = None):
         self.config = config
         self.session = None
+        self.owns_sessions = sessions is None
+        self.sessions = sessions or SessionFactory(
+            verify_ssl=config.downloads.verify_ssl,
+            api_connections=config.downloads.api_connections,
+            cdn_connections=config.downloads.cdn_connections,
+            cdn_connections_per_host=config.downloads.cdn_connections_per_host,
+            keepalive_timeout=config.downloads.keepalive_timeout,
+            dns_cache_ttl=config.downloads.dns_cache_ttl,
+        )
         self.logged_in = False
+        self.limiter = shared_limiter(config.downloads.requests_per_minute)
+        self.metadata = MetadataCache(
+            config.cache.path,
+            max_entries=config.cache.metadata_entries,
+            ttl=config.cache.metadata_ttl,
+        )
+        self.manifests = ManifestCache(config.cache.manifest_entries, config.cache.manifest_ttl)
+        self.covers = CoverCache(self.sessions, config.cache.cover_bytes, config.downloads.cover_size)
+        self._refresh_lock = asyncio.Lock()
+        self._refresher: Optional[asyncio.Task] = None
 
     async def login(self):
         """Login using device flow."""
-        self.session = aiohttp.ClientSession()
+        self.session = self.sessions.api
         
         if not self.config.tidal.access_token:
             await self._device_login()
+        elif self._token_expiring() and self.config.tidal.refresh_token:
+            await self.refresh_token()
         else:
             await self._login_by_access_token()
         
         self.logged_in = True
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.create_task(self._refresh_loop())
+
+    @asynccontextmanager
+    async def request(self, method: str, url: str, **kwargs):
+        """Send an API request through the rate limiter, waiting out 429s.
+        
+        A 401 refreshes the access token once and replays the request.
+        """
+        authorized = not url.startswith(self.config.tidal.auth_url) and bool(self.config.tidal.access_token)
+        resp = await self._send(method, url, authorized, **kwargs)
+        if resp.status == 401 and authorized and self.config.tidal.refresh_token:
+            stale = resp.request_info.headers.get("authorization", "")
+            resp.release()
+            await self.refresh_token(stale.removeprefix("Bearer "))
+            resp = await self._send(method, url, authorized, **kwargs)
+        
+        try:
+            yield resp
+        finally:
+            resp.release()
+
+    async def _send(self, method: str, url: str, authorized: bool, **kwargs) -> aiohttp.ClientResponse:
+        if authorized:
+            # Per request rather than on the session, which is shared with
+            # the OAuth endpoints that authenticate with client credentials
+            kwargs["headers"] = {
+                "authorization": f"Bearer {self.config.tidal.access_token}",
+                **kwargs.get("headers", {}),
+            }
+        
+        for attempt in range(MAX_THROTTLE_RETRIES + 1):
+            await self.limiter.acquire()
+            resp = await self.session.request(method, url, **kwargs)
+            if resp.status != 429:
+                self.limiter.success()
+                return resp
+            if attempt == MAX_THROTTLE_RETRIES:
+                return resp
+            self.limiter.backoff(parse_retry_after(resp.headers.get("Retry-After")))
+            resp.release()
+
+    async def refresh_token(self, stale_token: Optional[str] = None):
+        """Renew the access token; concurrent callers share one refresh.
+        
+        With stale_token set, nothing happens if another caller already
+        replaced that token.
+        """
+        async with self._refresh_lock:
+            if stale_token is not None and self.config.tidal.access_token != stale_token:
+                return
+            
+            data = {
+                "client_id": CLIENT_ID,
+                "refresh_token": self.config.tidal.refresh_token,
+                "grant_type": "refresh_token",
+                "scope": "r_usr+w_usr+w_sub",
+            }
+            async with self.request("POST", f"{self.config.tidal.auth_url}/token", data=data, auth=AUTH) as resp:
+                resp_data = await resp.json()
+            
+            if "access_token" not in resp_data:
+                raise AuthenticationError(resp_data.get("userMessage", "Token refresh failed"))
+            
+            self.config.tidal.access_token = resp_data["access_token"]
+            # Tidal only sometimes rotates the refresh token
+            self.config.tidal.refresh_token = resp_data.get("refresh_token", self.config.tidal.refresh_token)
+            self.config.tidal.token_expiry = str(resp_data["expires_in"] + time.time())
+
+    def _token_expiring(self) -> bool:
+        return time.time() > float(self.config.tidal.token_expiry) - self.config.tidal.refresh_margin
+
+    async def _refresh_loop(self):
+        """Renew the token before it expires, for as long as the client lives."""
+        while True:
+            if not self._token_expiring() or not self.config.tidal.refresh_token:
+                await asyncio.sleep(REFRESH_CHECK_INTERVAL)
+                continue
+            try:
+                await self.refresh_token(self.config.tidal.access_token)
+            except (aiohttp.ClientError, asyncio.TimeoutError, AuthenticationError) as e:
+                print(f"Token refresh failed: {e}")
+                await asyncio.sleep(REFRESH_RETRY_DELAY)
+
+    async def close(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            await asyncio.gather(self._refresher, return_exceptions=True)
+            self._refresher = None
+        if self.owns_sessions:
+            await self.sessions.close()
+        await self.metadata.close()
 
     async def _device_login(self):
         """Login using device code flow."""
         data = {"client_id": CLIENT_ID, "scope": "r_usr+w_usr+w_sub"}
         
-        async with self.session.post(f"{AUTH_URL}/device_authorization", data=data) as resp:
+        async with self.request("POST", f"{self.config.tidal.auth_url}/device_authorization", data=data) as resp:
             resp_data = await resp.json()
         
         device_code = resp_data["deviceCode"]
@@ -69,7 +189,7 @@ class TidalClient(Client):
         for _ in range(150):  # 10 minutes
             await asyncio.sleep(4)
             
-            async with self.session.post(f"{AUTH_URL}/token", data=data, auth=AUTH) as resp:
+            async with self.request("POST", f"{self.config.tidal.auth_url}/token", data=data, auth=AUTH) as resp:
                 resp_data = await resp.json()
             
             if "access_token" in resp_data:
@@ -78,22 +198,14 @@ class TidalClient(Client):
                 self.config.tidal.token_expiry = str(resp_data["expires_in"] + time.time())
                 self.config.tidal.user_id = resp_data["user"]["userId"]
                 self.config.tidal.country_code = resp_data["user"]["countryCode"]
-                
-                self.session.headers.update({
-                    "authorization": f"Bearer {self.config.tidal.access_token}"
-                })
                 return
         
         raise AuthenticationError("Authentication timeout")
 
     async def _login_by_access_token(self):
         """Login using stored access token."""
-        self.session.headers.update({
-            "authorization": f"Bearer {self.config.tidal.access_token}"
-        })
-        
         # Verify token is still valid
-        async with self.session.get("https://api.tidal.com/v1/sessions") as resp:
+        async with self.request("GET", f"{self.config.tidal.api_url}/sessions") as resp:
             resp_data = await resp.json()
         
         if resp_data.get("status", 200) != 200:
@@ -101,19 +213,97 @@ class TidalClient(Client):
 
     async def get_metadata(self, item_id: str, media_type: str) -> dict:
         """Get track metadata."""
+        key = f"{media_type}:{item_id}:{self.config.tidal.country_code}"
+        cached = await self.metadata.get(key)
+        if cached is not None:
+            return cached
+        
         params = {
             "countryCode": self.config.tidal.country_code,
             "limit": 100
         }
         
-        async with self.session.get(f"{BASE}/tracks/{item_id}", params=params) as resp:
+        async with self.request("GET", f"{self.config.tidal.api_url}/tracks/{item_id}", params=params) as resp:
             if resp.status == 404:
                 raise NonStreamableError("Track not found")
             resp.raise_for_status()
-            return await resp.json()
+            metadata = await resp.json()
+        
+        await self.metadata.set(key, metadata)
+        return metadata
+
+    async def tag(self, path: str, extension: str, metadata: dict) -> bool:
+        """Write tags and album art from track metadata into a downloaded file."""
+        cover_id = metadata.get("album", {}).get("cover")
+        cover = await self.covers.get(cover_id) if cover_id else None
+        return await tag_file(path, extension, tags_from_metadata(metadata), cover)
 
-    async def get_downloadable(self, track_id: str, quality: int):
-        """Get downloadable track URL."""
+    async def get_album_tracks(self, album_id: str) -> list[str]:
+        """Get the track IDs of an album."""
+        return await self._get_track_ids(f"{self.config.tidal.api_url}/albums/{album_id}/items")
+
+    async def get_playlist_tracks(self, playlist_id: str) -> list[str]:
+        """Get the track IDs of a playlist."""
+        return await self._get_track_ids(f"{self.config.tidal.api_url}/playlists/{playlist_id}/items")
+
+    async def _get_track_ids(self, url: str) -> list[str]:
+        """Walk a paginated items listing and collect track IDs."""
+        track_ids = []
+        offset = 0
+        
+        while True:
+            params = {
+                "countryCode": self.config.tidal.country_code,
+                "limit": 100,
+                "offset": offset,
+            }
+            async with self.request("GET", url, params=params) as resp:
+                if resp.status == 404:
+                    raise NonStreamableError("Album or playlist not found")
+                resp.raise_for_status()
+                resp_data = await resp.json()
+            
+            items = resp_data.get("items", [])
+            for entry in items:
+                if entry.get("type", "track") == "track":
+                    track_ids.append(str(entry["item"]["id"]))
+            
+            offset += len(items)
+            if not items or offset >= resp_data.get("totalNumberOfItems", 0):
+                return track_ids
+
+    async def get_downloadable(self, track_id: str, quality: int, segments: Optional[int] = None):
+        """Get downloadable track URL; segments overrides the configured Range split."""
+        manifest = await self._get_manifest(track_id, quality)
+
+        async def resolve() -> Manifest:
+            # The CDN rejected the signed URLs; skip the cache and fetch fresh ones
+            return await self._get_manifest(track_id, quality, fresh=True)
+
+        return Downloadable.from_manifest(
+            self.sessions.cdn,
+            manifest,
+            source="tidal",
+            segments=segments or self.config.downloads.segments,
+            window=self.config.downloads.dash_window,
+            chunk_size=self.config.downloads.chunk_size,
+            buffer_size=self.config.downloads.write_buffer_size,
+            retries=self.config.downloads.retries,
+            resolve=resolve,
+        )
+
+    async def _get_manifest(self, track_id: str, quality: int, fresh: bool = False) -> Manifest:
+        """Fetch and decode the playback manifest (BTS JSON or DASH MPD).
+        
+        Manifests are reused until shortly before their signed URLs expire,
+        unless fresh is set.
+        """
+        key = (track_id, quality, self.config.tidal.country_code)
+        if not fresh:
+            cached = self.manifests.get(key)
+            if cached is not None:
+                return cached
+        
         params = {
             "audioquality": QUALITY_MAP[quality],
             "playbackmode": "STREAM",
@@ -121,20 +311,16 @@ class TidalClient(Client):
             "countryCode": self.config.tidal.country_code,
         }
         
-        async with self.session.get(
-            f"{BASE}/tracks/{track_id}/playbackinfopostpaywall", 
+        async with self.request(
+            "GET", f"{self.config.tidal.api_url}/tracks/{track_id}/playbackinfopostpaywall", 
             params=params
         ) as resp:
             resp_data = await resp.json()
         
         try:
-            manifest = json.loads(base64.b64decode(resp_data["manifest"]).decode("utf-8"))
+            manifest = parse_manifest(resp_data)
         except KeyError:
             raise Exception(resp_data.get("userMessage", "Unknown error"))
         
-        return Downloadable(
-            self.session,
-            url=manifest["urls"][0],
-            extension="flac" if quality >= 2 else "m4a",
-            source="tidal"
-        )
\ No newline at end of file
+        self.manifests.set(key, manifest)
+        return manifest